@@ -1,18 +1,36 @@
-from fastapi import FastAPI, HTTPException, Request, Depends
+from fastapi import FastAPI, HTTPException, Query, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import APIKeyHeader
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, ValidationError
 import re
-from typing import List, Optional
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Literal, Optional, Tuple, Union
 # Old ML imports removed - now using Claude API via dynamic_analyzer.py
+import asyncio
+import codecs
+import contextlib
+import json
 import logging
 import time
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
-import html
-import re
+import hmac
 from urllib.parse import urlparse
+from delta import DocumentVersionStore
+from fast_json import FastJSONResponse
+from request_limits import BodySizeLimitMiddleware, BodyTooLargeError
+from metrics import CONTENT_TYPE, RATE_LIMITED, REGISTRY, STAGE_SECONDS
+from pattern_engine import PATTERN_SET_VERSION, RED_FLAG_ENGINE, RED_FLAG_PATTERNS, find_matches
+from rate_limiter import InMemoryBackend, RateLimit, RateLimiter, SQLiteBackend, parse_limits
+from result_cache import ResultCache, content_key
+from rule_engine import get_engine
+from segmenter import CONTEXT_MAX_LENGTH, BoundaryIndex
+from singleflight import SingleFlight
+from stream_scanner import TopFlags, WindowedScanner, iter_chunks, scan_stream
+from span_format import OffsetMap
+from warmup import warm_up
 
 # Configure logging
 logging.basicConfig(
@@ -21,19 +39,89 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up(analyze_red_flags, analyze_red_flag_spans, prepare_text)
+    yield
+    # Stop batch workers with the server
+    if _batch_pool is not None:
+        _batch_pool.shutdown(wait=False, cancel_futures=True)
+
 app = FastAPI(
     title="REDFLAGGED API",
     description="API for analyzing contracts and detecting red flags",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # Security
 API_KEY_NAME = "X-API-Key"
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
 
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "")
+
 # Rate limiting
 RATE_LIMIT_REQUESTS = 100  # requests per minute
 RATE_LIMIT_WINDOW = 60  # seconds
+# Per-route and per-API-key overrides as JSON, e.g. {"/api/analyze": [30, 60]}
+ROUTE_RATE_LIMITS = parse_limits(os.getenv("RATE_LIMIT_ROUTES", ""))
+API_KEY_RATE_LIMITS = parse_limits(os.getenv("RATE_LIMIT_API_KEYS", ""))
+# "memory" (per worker) or "sqlite" (shared by every worker on the host)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_SQLITE_PATH = os.getenv(
+    "RATE_LIMIT_SQLITE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "rate_limits.sqlite3")
+)
+
+def create_rate_limiter() -> RateLimiter:
+    """Build the rate limiter from the environment configuration"""
+    default_limit = RateLimit(RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW)
+    windows = [default_limit.window]
+    windows += [limit.window for limit in ROUTE_RATE_LIMITS.values()]
+    windows += [limit.window for limit in API_KEY_RATE_LIMITS.values()]
+    # A counter says nothing useful once two full windows have passed
+    idle_timeout = 2 * max(windows)
+
+    if RATE_LIMIT_BACKEND == 'sqlite':
+        backend = SQLiteBackend(RATE_LIMIT_SQLITE_PATH, idle_timeout)
+    else:
+        backend = InMemoryBackend(idle_timeout)
+    return RateLimiter(backend, default_limit, ROUTE_RATE_LIMITS, API_KEY_RATE_LIMITS)
+
+rate_limiter = create_rate_limiter()
+
+# Analysis result cache
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", "3600"))  # seconds
+
+analysis_cache = ResultCache(max_bytes=ANALYSIS_CACHE_MAX_BYTES, ttl=ANALYSIS_CACHE_TTL)
+
+# Identical texts that miss the cache at the same time share one scan
+scans_in_flight = SingleFlight('analyze_red_flags')
+
+# Last analyzed version of each client document, for delta requests
+document_versions = DocumentVersionStore()
+
+# Batch analysis
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", str(os.cpu_count() or 1)))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "10000"))
+# Documents queued to the pool at once, so a huge batch is not all held in memory
+BATCH_MAX_IN_FLIGHT = BATCH_WORKERS * 4
+
+_batch_pool: Optional[ProcessPoolExecutor] = None
+
+# Input limits; body sizes are enforced while the body is read, before JSON decoding
+MAX_TEXT_CHARS = 1000000
+AUDIT_MAX_TEXT_CHARS = int(os.getenv("AUDIT_MAX_TEXT_CHARS", "200000"))
+ANALYZE_MAX_BODY_BYTES = int(os.getenv("ANALYZE_MAX_BODY_BYTES", str(4 * 1024 * 1024)))
+BATCH_MAX_BODY_BYTES = int(os.getenv("BATCH_MAX_BODY_BYTES", str(256 * 1024 * 1024)))
+STREAM_MAX_BODY_BYTES = int(os.getenv("STREAM_MAX_BODY_BYTES", str(256 * 1024 * 1024)))
+# Per-route body limits; every other route gets ANALYZE_MAX_BODY_BYTES
+BODY_LIMITS = {"/api/analyze/batch": BATCH_MAX_BODY_BYTES, "/api/analyze/stream": STREAM_MAX_BODY_BYTES}
+
+# Flags of each category sent by /api/analyze/stream, the most confident first; 0 sends every flag
+STREAM_MAX_PER_CATEGORY = int(os.getenv("STREAM_MAX_PER_CATEGORY", "50"))
 
 # Configure CORS with specific origins
 ALLOWED_ORIGINS = [
@@ -46,11 +134,9 @@ ALLOWED_ORIGINS = [
 ]
 
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=ALLOWED_ORIGINS,
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "OPTIONS"],
-    allow_headers=["Content-Type", "Authorization", "X-API-Key"],
+    BodySizeLimitMiddleware,
+    limits=BODY_LIMITS,
+    default_limit=ANALYZE_MAX_BODY_BYTES
 )
 
 # Note: Old ML model initialization removed
@@ -59,6 +145,10 @@ app.add_middleware(
 class ContractRequest(BaseModel):
     text: str
     source_url: Optional[str] = None
+    # Client-chosen ID; resubmissions only re-scan the paragraphs that changed
+    document_id: Optional[str] = Field(None, max_length=256)
+    # "compact" returns offsets and a category table instead of per-flag copies of text
+    response_format: Literal['full', 'compact'] = 'full'
 
 class RedFlag(BaseModel):
     category: str
@@ -74,51 +164,85 @@ class AnalysisResponse(BaseModel):
     red_flags: List[RedFlag]
     analysis_timestamp: str
     model_version: str
+    cache_hit: bool = False
+    delta: Optional[Dict[str, int]] = None
+
+class RedFlagCategory(BaseModel):
+    category: str
+    severity: str
+    description: str
+    recommendation: str
+    count: int
+
+class RedFlagSpan(BaseModel):
+    # Key into the categories table
+    pattern: str
+    # Sentence containing the matches, as [start, end) offsets into the submitted text
+    start: int
+    end: int
+    matches: List[List[int]]
+    confidence: float
+
+class CompactAnalysisResponse(BaseModel):
+    risk_level: str
+    word_count: int
+    categories: Dict[str, RedFlagCategory]
+    flags: List[RedFlagSpan]
+    analysis_timestamp: str
+    model_version: str
+    cache_hit: bool = False
+
+class BatchDocument(BaseModel):
+    id: Optional[str] = None
+    text: str
+
+class BatchRequest(BaseModel):
+    documents: List[BatchDocument]
+
+class CacheInvalidateRequest(BaseModel):
+    key: Optional[str] = None
+    text: Optional[str] = None
 
 # Rate limiting middleware
 @app.middleware("http")
 async def rate_limit_middleware(request: Request, call_next):
-    client_ip = request.client.host
-    current_time = time.time()
-    
-    # Get or create rate limit data for this IP
-    if not hasattr(app.state, 'rate_limit_data'):
-        app.state.rate_limit_data = {}
+    client_ip = request.client.host if request.client else "unknown"
+    check_args = (request.url.path, client_ip, request.headers.get(API_KEY_NAME))
+    if rate_limiter.blocking:
+        # The shared SQLite backend can wait on other workers' locks
+        allowed, retry_after = await asyncio.to_thread(rate_limiter.check, *check_args)
+    else:
+        allowed, retry_after = rate_limiter.check(*check_args)
     
-    if client_ip not in app.state.rate_limit_data:
-        app.state.rate_limit_data[client_ip] = {
-            'requests': [],
-            'last_reset': current_time
-        }
-    
-    # Clean old requests
-    client_data = app.state.rate_limit_data[client_ip]
-    client_data['requests'] = [
-        req_time for req_time in client_data['requests']
-        if current_time - req_time < RATE_LIMIT_WINDOW
-    ]
-    
-    # Check rate limit
-    if len(client_data['requests']) >= RATE_LIMIT_REQUESTS:
-        raise HTTPException(
+    # Exceptions raised here bypass FastAPI's handlers, so answer directly
+    if not allowed:
+        RATE_LIMITED.inc(route=rate_limiter.route_for(request.url.path)[0])
+        return JSONResponse(
             status_code=429,
-            detail="Too many requests. Please try again later."
+            content={"detail": "Too many requests. Please try again later."},
+            headers={"Retry-After": str(retry_after)}
         )
     
-    # Add current request
-    client_data['requests'].append(current_time)
-    
     # Process request
     response = await call_next(request)
     return response
 
+# Added last so it is outermost: 429 and 413 responses carry CORS headers too
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=ALLOWED_ORIGINS,
+    allow_credentials=True,
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization", "X-API-Key"],
+)
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
-        "model_loaded": analyzer.model is not None
+        "pattern_set_version": PATTERN_SET_VERSION
     }
 
 # Input validation functions
@@ -132,22 +256,57 @@ def validate_url(url: str) -> bool:
     except:
         return False
 
+def analysis_cache_key(text: str) -> str:
+    """Cache key for a prepared text under the current pattern set and settings"""
+    return content_key(text, PATTERN_SET_VERSION, RED_FLAG_ENGINE, str(CONTEXT_MAX_LENGTH))
+
+def require_admin_key(api_key: Optional[str] = Depends(api_key_header)) -> str:
+    """Only allow requests carrying the configured admin API key"""
+    if not ADMIN_API_KEY or not api_key or not hmac.compare_digest(api_key, ADMIN_API_KEY):
+        raise HTTPException(
+            status_code=403,
+            detail="Admin API key required"
+        )
+    return api_key
+
+# HTML escapes for submitted text, applied in a single pass
+_HTML_ESCAPES = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#x27;'}
+_SANITIZE_TABLE = str.maketrans(_HTML_ESCAPES)
+_SANITIZE_PATTERN = re.compile('[&<>"\']')
+# Preparing also drops carriage returns, so CRLF and LF pages hash the same
+_PREPARE_ESCAPES = {**_HTML_ESCAPES, '\r': ''}
+_PREPARE_TABLE = str.maketrans(_PREPARE_ESCAPES)
+_PREPARE_PATTERN = re.compile('[&<>"\'\r]')
+
+def _translate(text: str, table: dict, pattern: re.Pattern, escapes: dict) -> str:
+    """Rewrite special characters in one pass without intermediate copies"""
+    if len(text) > MAX_TEXT_CHARS:
+        # Escaping never shortens text, so refuse before doing any work
+        raise ValueError("Input text too long")
+    # str.translate is fastest on ASCII text but slow on anything else
+    if text.isascii():
+        result = text.translate(table)
+    else:
+        result = pattern.sub(lambda m: escapes[m.group()], text)
+    if len(result) > MAX_TEXT_CHARS:
+        raise ValueError("Input text too long")
+    return result
+
 def sanitize_text(text: str) -> str:
     """Sanitize text input to prevent XSS and injection attacks"""
     if not text:
         return ""
-    
-    # HTML escape
-    sanitized = html.escape(text)
-    
-    # Remove potentially dangerous characters
-    sanitized = re.sub(r'[<>"\']', '', sanitized)
-    
-    # Limit length
-    if len(sanitized) > 1000000:  # 1MB limit
-        raise ValueError("Input text too long")
-    
-    return sanitized
+    return _translate(text, _SANITIZE_TABLE, _SANITIZE_PATTERN, _HTML_ESCAPES)
+
+def prepare_text(text: str) -> str:
+    """Normalize line endings, escape and trim submitted text so repeat pages hash the same"""
+    if not text:
+        return ""
+    return _translate(text, _PREPARE_TABLE, _PREPARE_PATTERN, _PREPARE_ESCAPES).strip()
+
+def prepare_chunk(text: str) -> str:
+    """prepare_text for one piece of a streamed document; the scanner strips the ends"""
+    return _translate(text, _PREPARE_TABLE, _PREPARE_PATTERN, _PREPARE_ESCAPES)
 
 def validate_contract_request(request: ContractRequest) -> ContractRequest:
     """Validate and sanitize contract request"""
@@ -158,9 +317,10 @@ def validate_contract_request(request: ContractRequest) -> ContractRequest:
             detail="Invalid URL format"
         )
     
-    # Sanitize text
+    # Normalize and sanitize text
     try:
-        request.text = sanitize_text(request.text)
+        with STAGE_SECONDS.time(stage='sanitize'):
+            request.text = prepare_text(request.text)
     except ValueError as e:
         raise HTTPException(
             status_code=400,
@@ -177,38 +337,49 @@ def validate_contract_request(request: ContractRequest) -> ContractRequest:
     return request
 
 # Main analysis endpoint
-@app.post("/api/analyze", response_model=AnalysisResponse)
+@app.post("/api/analyze", response_model=Union[AnalysisResponse, CompactAnalysisResponse])
 async def analyze_contract(
     request: ContractRequest,
     api_key: Optional[str] = Depends(api_key_header)
 ):
     try:
+        compact = request.response_format == 'compact'
+        if compact and request.document_id:
+            raise HTTPException(
+                status_code=400,
+                detail="The compact format cannot be combined with document_id"
+            )
+        submitted_text = request.text
+        
         # Validate and sanitize input
         request = validate_contract_request(request)
+        if request.document_id:
+            return FastJSONResponse(
+                await asyncio.to_thread(build_delta_analysis_result, request.document_id, request.text)
+            )
         
-        # Log request (excluding sensitive data)
-        logger.info(f"Received analysis request from {request.source_url or 'unknown source'}")
-        
-        # Fallback to pattern-based analysis (ML model removed)
-        analysis = analyze_red_flags(request.text)
-        word_count = len(request.text.split())
-        
-        # Determine risk level based on red flags
-        risk_level = 'low'
-        if any(flag['severity'] == 'high' for flag in analysis):
-            risk_level = 'high'
-        elif any(flag['severity'] == 'medium' for flag in analysis):
-            risk_level = 'medium'
-        
-        analysis_result = {
-            'risk_level': risk_level,
-            'word_count': word_count,
-            'red_flags': analysis,
-            'analysis_timestamp': datetime.utcnow().isoformat(),
-            'model_version': 'pattern-matching-v2'
-        }
+        # Repeat pages are served from the cache without scanning again
+        cache_key = analysis_cache_key(request.text)
+        if compact:
+            cache_key = content_key(cache_key, 'compact')
+        analysis_result = analysis_cache.get(cache_key)
+        if analysis_result is not None:
+            logger.info(f"Serving cached analysis for {request.source_url or 'unknown source'}")
+            analysis_result = {**analysis_result, 'cache_hit': True}
+        else:
+            # Log request (excluding sensitive data)
+            logger.info(f"Received analysis request from {request.source_url or 'unknown source'}")
+            
+            # Fallback to pattern-based analysis (ML model removed)
+            analysis_result = await scans_in_flight.do(
+                cache_key, lambda: scan_and_cache(request.text, compact, cache_key)
+            )
         
-        return analysis_result
+        if compact:
+            # Cached spans index the prepared text; clients index what they sent
+            analysis_result = map_compact_offsets(analysis_result, submitted_text)
+        # Results are built here, so skip response_model revalidation
+        return FastJSONResponse(analysis_result)
         
     except HTTPException:
         # Re-raise HTTP exceptions
@@ -220,23 +391,7 @@ async def analyze_contract(
         # Return generic error message to client
         try:
             # Fallback to pattern-based analysis if ML model fails
-            analysis = analyze_red_flags(request.text)
-            word_count = len(request.text.split())
-            
-            # Determine risk level based on red flags
-            risk_level = 'low'
-            if any(flag['severity'] == 'high' for flag in analysis):
-                risk_level = 'high'
-            elif any(flag['severity'] == 'medium' for flag in analysis):
-                risk_level = 'medium'
-            
-            return {
-                'risk_level': risk_level,
-                'word_count': word_count,
-                'red_flags': analysis,
-                'analysis_timestamp': datetime.utcnow().isoformat(),
-                'model_version': 'pattern-matching-fallback'
-            }
+            return FastJSONResponse(build_analysis_result(request.text, 'pattern-matching-fallback'))
         except Exception as fallback_error:
             logger.error(f"Fallback analysis failed: {str(fallback_error)}")
             raise HTTPException(
@@ -244,110 +399,456 @@ async def analyze_contract(
                 detail="Unable to process contract analysis at this time"
             )
 
-def analyze_red_flags(text: str) -> List[dict]:
-    # Define red flag patterns
-    patterns = {
-        'autoRenewal': {
-            'regex': r'(auto|automatic|automatically)\s+renew|renewal|renewed|renewing',
-            'severity': 'high',
-            'category': 'Automatic Renewal',
-            'description': 'Contract automatically renews without explicit consent',
-            'recommendation': 'Request removal or modification of automatic renewal clause'
-        },
-        'unclearCancellation': {
-            'regex': r'(cancel|cancellation|terminate|termination|end|ending|expire|expiration)',
-            'severity': 'medium',
-            'category': 'Cancellation Terms',
-            'description': 'Cancellation process is not clearly defined',
-            'recommendation': 'Request specific cancellation procedures and timelines'
-        },
-        'liability': {
-            'regex': r'(liability|responsible|responsibility|obligation|obligations|indemnify|indemnification)',
-            'severity': 'low',
-            'category': 'Liability',
-            'description': 'Standard liability limitations present',
-            'recommendation': 'Review liability limits and consider if they are reasonable'
-        },
-        'hiddenFees': {
-            'regex': r'(fee|fees|charge|charges|cost|costs|payment|payments|price|pricing|rate|rates)',
-            'severity': 'medium',
-            'category': 'Fees and Charges',
-            'description': 'Possible hidden fees or charges detected',
-            'recommendation': 'Request detailed breakdown of all fees and charges'
-        },
-        'dataCollection': {
-            'regex': r'(data|information|collect|collection|share|sharing|privacy|confidential|confidentiality)',
-            'severity': 'medium',
-            'category': 'Data Privacy',
-            'description': 'Extensive data collection or sharing terms present',
-            'recommendation': 'Review data collection and sharing policies'
-        },
-        'arbitration': {
-            'regex': r'(arbitration|arbitrate|arbitrator|dispute|disputes|litigation|court|courts)',
-            'severity': 'high',
-            'category': 'Dispute Resolution',
-            'description': 'Mandatory arbitration or dispute resolution terms present',
-            'recommendation': 'Review dispute resolution process and consider if it favors your interests'
-        },
-        'intellectualProperty': {
-            'regex': r'(intellectual property|patent|patents|copyright|copyrights|trademark|trademarks|license|licenses)',
-            'severity': 'medium',
-            'category': 'Intellectual Property',
-            'description': 'Intellectual property rights and licensing terms present',
-            'recommendation': 'Review IP rights and licensing terms carefully'
-        },
-        'nonCompete': {
-            'regex': r'(non-compete|noncompete|restrict|restriction|restrictions|compete|competition)',
-            'severity': 'high',
-            'category': 'Non-Compete',
-            'description': 'Non-compete or restrictive covenants present',
-            'recommendation': 'Review scope and duration of non-compete provisions'
-        },
-        'forceMajeure': {
-            'regex': r'(force majeure|act of god|unforeseen|unforeseeable|circumstances|beyond control)',
-            'severity': 'medium',
-            'category': 'Force Majeure',
-            'description': 'Force majeure or unforeseeable circumstances clause present',
-            'recommendation': 'Review force majeure provisions and their implications'
-        },
-        'assignment': {
-            'regex': r'(assign|assignment|transfer|transfers|transferable|assignable)',
-            'severity': 'medium',
-            'category': 'Assignment Rights',
-            'description': 'Contract assignment or transfer rights present',
-            'recommendation': 'Review assignment rights and restrictions'
-        }
+async def scan_and_cache(text: str, compact: bool, cache_key: str) -> dict:
+    """Scan prepared text off the event loop and cache the result"""
+    build = build_compact_analysis_result if compact else build_analysis_result
+    analysis_result = await asyncio.to_thread(build, text, 'pattern-matching-v2')
+    analysis_cache.put(cache_key, analysis_result)
+    return analysis_result
+
+def build_analysis_result(text: str, model_version: str, analysis: Optional[List[dict]] = None) -> dict:
+    """Run the pattern analysis on sanitized text and assemble the response"""
+    if analysis is None:
+        with STAGE_SECONDS.time(stage='pattern_scan'):
+            analysis = analyze_red_flags(text)
+    word_count = len(text.split())
+    
+    # Determine risk level based on red flags
+    risk_level = 'low'
+    if any(flag['severity'] == 'high' for flag in analysis):
+        risk_level = 'high'
+    elif any(flag['severity'] == 'medium' for flag in analysis):
+        risk_level = 'medium'
+    
+    return {
+        'risk_level': risk_level,
+        'word_count': word_count,
+        'red_flags': analysis,
+        'analysis_timestamp': datetime.utcnow().isoformat(),
+        'model_version': model_version,
+        'cache_hit': False
     }
+
+def build_compact_analysis_result(text: str, model_version: str) -> dict:
+    """Compact pattern analysis of prepared text; offsets index the prepared text"""
+    with STAGE_SECONDS.time(stage='pattern_scan'):
+        categories, flags = analyze_red_flag_spans(text)
     
-    red_flags = []
-    for pattern_name, pattern in patterns.items():
-        matches = re.finditer(pattern['regex'], text, re.IGNORECASE)
-        for match in matches:
-            # Get context around the match with 90 characters on each side
-            start = max(0, match.start() - 90)
-            end = min(len(text), match.end() + 90)
-            
-            # Try to get complete sentences
-            while start > 0 and text[start] not in '.!?':
-                start -= 1
-            while end < len(text) and text[end] not in '.!?':
-                end += 1
-            
-            context = text[start:end].strip()
+    severities = {entry['severity'] for entry in categories.values()}
+    risk_level = 'high' if 'high' in severities else 'medium' if 'medium' in severities else 'low'
+    
+    return {
+        'risk_level': risk_level,
+        'word_count': len(text.split()),
+        'categories': categories,
+        'flags': flags,
+        'analysis_timestamp': datetime.utcnow().isoformat(),
+        'model_version': model_version,
+        'cache_hit': False
+    }
+
+def map_compact_offsets(result: dict, submitted_text: str) -> dict:
+    """Rewrite a compact result's offsets from the prepared text to the submitted text"""
+    offsets = OffsetMap(submitted_text, _PREPARE_PATTERN, _PREPARE_ESCAPES)
+    flags = []
+    for flag in result['flags']:
+        start, end = offsets.to_source_span(flag['start'], flag['end'])
+        flags.append({
+            **flag,
+            'start': start,
+            'end': end,
+            'matches': [offsets.to_source_span(s, e) for s, e in flag['matches']]
+        })
+    return {**result, 'flags': flags}
+
+def build_delta_analysis_result(document_id: str, text: str) -> dict:
+    """
+    Scan only the paragraphs that changed since the document's last version.
+    Every version is scanned paragraph by paragraph, so flag context never
+    crosses a paragraph boundary and reused flags match a fresh scan.
+    """
+    key = analysis_cache_key(document_id)
+    plan = document_versions.plan(key, text)
+    with STAGE_SECONDS.time(stage='pattern_scan'):
+        for index in plan.pending:
+            plan.results[index] = analyze_red_flags(plan.paragraphs[index][1])
+    document_versions.commit(key, plan)
+    
+    stats = plan.stats()
+    logger.info(f"Delta analysis of {document_id}: {stats}")
+    red_flags = [flag for flags in plan.results for flag in flags]
+    return {**build_analysis_result(text, 'pattern-matching-v2', red_flags), 'delta': stats}
+
+def analyze_batch_item(text: str) -> dict:
+    """Analyze one prepared batch document; runs in a worker process"""
+    if len(text) < 10:
+        raise ValueError("Contract text must be at least 10 characters long")
+    return build_analysis_result(text, 'pattern-matching-v2')
+
+def get_batch_pool() -> ProcessPoolExecutor:
+    """Create the batch worker pool on first use"""
+    global _batch_pool
+    if _batch_pool is None:
+        _batch_pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS)
+    return _batch_pool
+
+async def read_batch_items(request: Request) -> AsyncIterator[Tuple[int, object]]:
+    """Yield (index, BatchDocument or error message) from a JSON or NDJSON batch body"""
+    content_type = request.headers.get('content-type', '')
+    if 'ndjson' not in content_type and 'jsonlines' not in content_type:
+        try:
+            batch = BatchRequest.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid batch request: {e.errors()[0]['msg']}")
+        if len(batch.documents) > BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=400, detail=f"Batch exceeds {BATCH_MAX_ITEMS} documents")
+        for index, document in enumerate(batch.documents):
+            yield index, document
+        return
+
+    # NDJSON: one document per line, parsed as the body streams in
+    index = 0
+    buffer = b''
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            if not line.strip():
+                continue
+            if index >= BATCH_MAX_ITEMS:
+                yield index, f"Batch exceeds {BATCH_MAX_ITEMS} documents"
+                return
+            try:
+                yield index, BatchDocument.model_validate_json(line)
+            except ValidationError as e:
+                yield index, f"Invalid document: {e.errors()[0]['msg']}"
+            index += 1
+        if len(buffer) > ANALYZE_MAX_BODY_BYTES:
+            # One document may not be larger than a single analysis request
+            yield index, f"Document exceeds {ANALYZE_MAX_BODY_BYTES} bytes"
+            return
+    if buffer.strip() and index < BATCH_MAX_ITEMS:
+        try:
+            yield index, BatchDocument.model_validate_json(buffer)
+        except ValidationError as e:
+            yield index, f"Invalid document: {e.errors()[0]['msg']}"
+
+async def run_batch(items: AsyncIterator[Tuple[int, object]]) -> AsyncIterator[str]:
+    """Fan documents out to the process pool and yield NDJSON lines in completion order"""
+    loop = asyncio.get_running_loop()
+    pool = get_batch_pool()
+    pending = {}
+    next_item = None
+    exhausted = False
+    # Index the next item from the body gets
+    received = 0
+    
+    def line(index: int, document_id: Optional[str], **fields) -> str:
+        return json.dumps({'index': index, 'id': document_id, **fields}, separators=(',', ':')) + '\n'
+    
+    try:
+        while True:
+            if not exhausted and next_item is None and len(pending) < BATCH_MAX_IN_FLIGHT:
+                next_item = asyncio.ensure_future(items.__anext__())
+            waiting = set(pending) | ({next_item} if next_item else set())
+            if not waiting:
+                break
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
             
-            # Calculate confidence based on match quality
-            confidence = calculate_confidence(match.group(), context)
+            if next_item in done:
+                try:
+                    index, document = next_item.result()
+                    received = index + 1
+                except StopAsyncIteration:
+                    exhausted = True
+                    document = None
+                except (BodyTooLargeError, ValueError) as e:
+                    # The response has started, so a body that breaks off part way
+                    # (over the size limit, or malformed) ends with an error line
+                    exhausted = True
+                    document = None
+                    error = e.detail if isinstance(e, BodyTooLargeError) else "Invalid batch body"
+                    logger.warning(f"Batch body failed after {received} item(s): {error}")
+                    yield line(received, None, status='error', error=error)
+                next_item = None
+                
+                if isinstance(document, str):
+                    yield line(index, None, status='error', error=document)
+                elif document is not None:
+                    try:
+                        text = prepare_text(document.text)
+                    except ValueError as e:
+                        text = None
+                        yield line(index, document.id, status='error', error=str(e))
+                    if text is not None:
+                        cache_key = analysis_cache_key(text)
+                        cached_result = analysis_cache.get(cache_key)
+                        if cached_result is not None:
+                            yield line(index, document.id, status='ok', result={**cached_result, 'cache_hit': True})
+                        else:
+                            future = loop.run_in_executor(pool, analyze_batch_item, text)
+                            pending[future] = (index, document.id, cache_key)
             
-            red_flags.append({
+            for future in done & set(pending):
+                index, document_id, cache_key = pending.pop(future)
+                try:
+                    result = future.result()
+                except ValueError as e:
+                    yield line(index, document_id, status='error', error=str(e))
+                    continue
+                except Exception as e:
+                    logger.error(f"Batch item {index} failed: {e}")
+                    yield line(index, document_id, status='error', error="Analysis failed")
+                    continue
+                analysis_cache.put(cache_key, result)
+                yield line(index, document_id, status='ok', result={**result, 'cache_hit': False})
+    finally:
+        # Client went away: drop queued work
+        for future in pending:
+            future.cancel()
+        if next_item is not None:
+            next_item.cancel()
+
+# Batch analysis endpoint
+@app.post("/api/analyze/batch")
+async def analyze_batch(
+    request: Request,
+    api_key: Optional[str] = Depends(api_key_header)
+):
+    """
+    Analyze many documents, sent as {"documents": [...]} or as NDJSON, and
+    stream one NDJSON result line per document as each one finishes.
+    """
+    items = read_batch_items(request)
+    # Pull the first item now so a malformed JSON body is a 400, not a broken stream
+    try:
+        first = await items.__anext__()
+    except StopAsyncIteration:
+        first = None
+    
+    async def replay() -> AsyncIterator[Tuple[int, object]]:
+        if first is None:
+            return
+        yield first
+        async for item in items:
+            yield item
+    
+    return StreamingResponse(run_batch(replay()), media_type="application/x-ndjson")
+
+async def read_stream_text(request: Request) -> AsyncIterator[str]:
+    """Yield prepared text from a plain text body as it streams in, or from a ContractRequest JSON body"""
+    if 'json' in request.headers.get('content-type', ''):
+        # A JSON document is decoded whole, so it gets the normal body limit
+        body = b''
+        async for chunk in request.stream():
+            body += chunk
+            if len(body) > ANALYZE_MAX_BODY_BYTES:
+                raise BodyTooLargeError(ANALYZE_MAX_BODY_BYTES)
+        try:
+            text = ContractRequest.model_validate_json(body).text
+        except ValidationError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid request: {e.errors()[0]['msg']}")
+        for chunk in iter_chunks(text):
+            yield prepare_chunk(chunk)
+        return
+
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    async for chunk in request.stream():
+        # Pieces stay well under the length prepare_text accepts, whatever the server reads at once
+        for piece in iter_chunks(decoder.decode(chunk)):
+            yield prepare_chunk(piece)
+    yield prepare_chunk(decoder.decode(b'', final=True))
+
+async def stream_red_flags(chunks: AsyncIterator[str], max_per_category: int) -> AsyncIterator[str]:
+    """
+    Scan prepared text chunks window by window off the event loop and yield
+    NDJSON flag lines, then a summary line. Only the scan window and the kept
+    flags are held, however long the document is.
+    """
+    scanner = WindowedScanner()
+    top = TopFlags(max_per_category) if max_per_category else None
+    counts: Dict[str, int] = {}
+    severities = set()
+    word_count = 0
+    in_word = False
+    
+    def line(kind: str, fields: dict) -> str:
+        return json.dumps({'type': kind, **fields}, separators=(',', ':')) + '\n'
+    
+    def scan(chunk: Optional[str]) -> str:
+        nonlocal word_count, in_word
+        if chunk is None:
+            matches = scanner.finish()
+        else:
+            # A word cut between chunks is counted once
+            word_count += len(chunk.split()) - (1 if in_word and chunk[:1] and not chunk[0].isspace() else 0)
+            in_word = not chunk[-1].isspace() if chunk else in_word
+            matches = scanner.feed(chunk)
+        lines = []
+        for match in matches:
+            flag = build_red_flag(match.pattern, match.text, match.context)
+            severities.add(flag['severity'])
+            if top is not None:
+                top.add(flag)
+            else:
+                counts[flag['category']] = counts.get(flag['category'], 0) + 1
+                lines.append(line('flag', flag))
+        return ''.join(lines)
+    
+    with STAGE_SECONDS.time(stage='pattern_scan_stream'):
+        async for chunk in chunks:
+            lines = await asyncio.to_thread(scan, chunk)
+            if lines:
+                yield lines
+        lines = await asyncio.to_thread(scan, None)
+        if lines:
+            yield lines
+    
+    sent = sum(counts.values())
+    if top is not None:
+        counts = dict(top.counts)
+        kept = top.flags()
+        sent = len(kept)
+        for flag in kept:
+            yield line('flag', flag)
+    
+    risk_level = 'high' if 'high' in severities else 'medium' if 'medium' in severities else 'low'
+    yield line('summary', {
+        'risk_level': risk_level,
+        'word_count': word_count,
+        'flag_counts': counts,
+        'flags_sent': sent,
+        'analysis_timestamp': datetime.utcnow().isoformat(),
+        'model_version': 'pattern-matching-v2'
+    })
+
+# Streaming analysis endpoint
+@app.post("/api/analyze/stream")
+async def analyze_stream(
+    request: Request,
+    max_per_category: int = Query(STREAM_MAX_PER_CATEGORY, ge=0),
+    api_key: Optional[str] = Depends(api_key_header)
+):
+    """
+    Scan a document of any size, sent as plain text or as a ContractRequest,
+    and stream NDJSON: one line per flag, then a summary line. Flags are
+    capped at the max_per_category most confident of each category and sent
+    once the scan finishes; with 0, every flag is sent as soon as it is found.
+    """
+    chunks = read_stream_text(request)
+    # Read up to the first real text now so an empty document is a 400, not a broken stream
+    head = []
+    preview = ''
+    async for chunk in chunks:
+        head.append(chunk)
+        preview = (preview + chunk).lstrip()
+        if len(preview.rstrip()) >= 10:
+            break
+    if len(preview.rstrip()) < 10:
+        raise HTTPException(
+            status_code=400,
+            detail="Contract text must be at least 10 characters long"
+        )
+    
+    async def replay() -> AsyncIterator[str]:
+        for chunk in head:
+            yield chunk
+        async for chunk in chunks:
+            yield chunk
+    
+    return StreamingResponse(stream_red_flags(replay(), max_per_category), media_type="application/x-ndjson")
+
+# Constitutional audit endpoint
+@app.post("/api/audit")
+async def audit_contract(
+    request: ContractRequest,
+    api_key: Optional[str] = Depends(api_key_header)
+):
+    """Evaluate a contract against the audit constitution's rules and required clauses"""
+    request = validate_contract_request(request)
+    if len(request.text) > AUDIT_MAX_TEXT_CHARS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Contract text for an audit must be at most {AUDIT_MAX_TEXT_CHARS} characters"
+        )
+    with STAGE_SECONDS.time(stage='constitution_eval'):
+        return FastJSONResponse(await asyncio.to_thread(get_engine().evaluate, request.text))
+
+def analyze_red_flags(text: str, max_context: int = CONTEXT_MAX_LENGTH) -> List[dict]:
+    # Segment once so each match's context is a bisect, not a character walk
+    boundaries = BoundaryIndex(text)
+
+    red_flags = []
+    for pattern_name, match_start, match_end, match_text in find_matches(text):
+        # Get the complete sentence(s) around the match, capped at max_context
+        start, end = boundaries.context_span(match_start, match_end, max_length=max_context)
+        red_flags.append(build_red_flag(pattern_name, match_text, text[start:end].strip()))
+
+    return red_flags
+
+def build_red_flag(pattern_name: str, match_text: str, context: str) -> dict:
+    pattern = RED_FLAG_PATTERNS[pattern_name]
+    return {
+        'category': pattern['category'],
+        'severity': pattern['severity'],
+        'text': context,
+        'description': pattern['description'],
+        'recommendation': pattern['recommendation'],
+        # Calculate confidence based on match quality
+        'confidence': calculate_confidence(match_text, context)
+    }
+
+def iter_red_flags(chunks: Iterable[str], max_context: int = CONTEXT_MAX_LENGTH) -> Iterator[dict]:
+    """
+    The flags of analyze_red_flags for prepared text arriving in chunks,
+    yielded in document order while holding one scan window of the text
+    """
+    for match in scan_stream(chunks, max_context):
+        yield build_red_flag(match.pattern, match.text, match.context)
+
+def analyze_red_flag_spans(text: str, max_context: int = CONTEXT_MAX_LENGTH) -> Tuple[Dict[str, dict], List[dict]]:
+    """
+    The compact form of analyze_red_flags: category details once per pattern,
+    and one flag per pattern and sentence holding the offsets of every match in it
+    """
+    boundaries = BoundaryIndex(text)
+    categories: Dict[str, dict] = {}
+    groups: Dict[Tuple[str, int, int], dict] = {}
+    
+    for pattern_name, match_start, match_end, match_text in find_matches(text):
+        start, end = boundaries.context_span(match_start, match_end, max_length=max_context)
+        group = groups.get((pattern_name, start, end))
+        if group is None:
+            context = text[start:end]
+            # Same span as the stripped context text of the full format
+            stripped_start = start + len(context) - len(context.lstrip())
+            group = groups[(pattern_name, start, end)] = {
+                'pattern': pattern_name,
+                'start': stripped_start,
+                'end': stripped_start + len(context.strip()),
+                'matches': [],
+                'confidence': 0.0,
+                'context': context.strip()
+            }
+        group['matches'].append([match_start, match_end])
+        group['confidence'] = max(group['confidence'], calculate_confidence(match_text, group['context']))
+        
+        entry = categories.get(pattern_name)
+        if entry is None:
+            pattern = RED_FLAG_PATTERNS[pattern_name]
+            entry = categories[pattern_name] = {
                 'category': pattern['category'],
                 'severity': pattern['severity'],
-                'text': context,
                 'description': pattern['description'],
                 'recommendation': pattern['recommendation'],
-                'confidence': confidence
-            })
+                'count': 0
+            }
+        entry['count'] += 1
     
-    return red_flags
+    flags = sorted(groups.values(), key=lambda flag: (flag['start'], flag['pattern']))
+    for flag in flags:
+        del flag['context']
+    return categories, flags
 
 def calculate_confidence(match: str, context: str) -> float:
     # Calculate confidence based on match quality and context
@@ -364,6 +865,34 @@ def calculate_confidence(match: str, context: str) -> float:
     
     return min(confidence, 1.0)
 
+@app.get("/api/admin/cache/stats")
+async def cache_stats(api_key: str = Depends(require_admin_key)):
+    """Report analysis cache size, hit rate and evictions"""
+    return analysis_cache.stats()
+
+@app.post("/api/admin/cache/invalidate")
+async def cache_invalidate(
+    request: CacheInvalidateRequest,
+    api_key: str = Depends(require_admin_key)
+):
+    """Drop the cached result for a key or text, or the whole cache when neither is given"""
+    if request.key is None and request.text is not None:
+        try:
+            key = analysis_cache_key(prepare_text(request.text))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # A text has a full and a compact result, each under its own key
+        removed = analysis_cache.invalidate(key) + analysis_cache.invalidate(content_key(key, 'compact'))
+    else:
+        removed = analysis_cache.invalidate(request.key)
+    logger.info(f"Invalidated {removed} cached analysis result(s)")
+    return {"removed": removed}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics for this worker process"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 @app.get("/api/config")
 async def get_config():
     """
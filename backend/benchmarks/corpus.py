@@ -0,0 +1,81 @@
+"""
+Synthetic contract corpus
+Deterministic documents for benchmarking, built from clause templates with a seeded generator
+"""
+
+import random
+from typing import Dict, List
+
+SIZES = {
+    '1kb': 1024,
+    '10kb': 10 * 1024,
+    '100kb': 100 * 1024,
+    '1mb': 1024 * 1024
+}
+
+STYLES = ('punctuated', 'unpunctuated')
+
+# Clauses that trigger red flag patterns
+RISKY_CLAUSES = [
+    "We may share your personal data with third parties for marketing purposes",
+    "This subscription will automatically renew unless you cancel thirty days before the renewal date",
+    "Any dispute shall be resolved by binding arbitration and you waive the right to a class action",
+    "We reserve the right to modify these terms at any time without notice",
+    "A cancellation fee of fifty dollars applies to early termination of the service",
+    "The company shall not be liable for any indirect or consequential damages",
+    "We may terminate your account at our sole discretion",
+    "You grant us a perpetual, irrevocable license to use any content you submit",
+    "Late payments incur a penalty of five percent per month",
+    "We collect location data and browsing history to improve our services"
+]
+
+# Boilerplate that matches nothing
+NEUTRAL_CLAUSES = [
+    "The headings in this document are for convenience only",
+    "Notices will be delivered to the address listed on the order form",
+    "Each section should be read together with the schedules attached",
+    "The parties will meet quarterly to review the delivery schedule",
+    "Documentation is provided in the customer portal",
+    "Support requests are answered during normal business hours",
+    "The order form lists the products and quantities purchased",
+    "Training sessions are scheduled by mutual agreement"
+]
+
+PUNCTUATION = ['. ', '; ', ', ', '! ', '? ', ': ']
+
+
+def generate_document(size: int, style: str = 'punctuated', seed: int = 0, risky_share: float = 0.3) -> str:
+    """
+    Build a contract-like document of exactly size characters. Punctuated
+    text has short sentences and numbered sections; unpunctuated text runs
+    clauses together with no sentence or clause delimiters at all.
+    """
+    rng = random.Random(f"{seed}:{style}:{size}")
+    parts: List[str] = []
+    length = 0
+    section = 1
+
+    while length < size:
+        clause = rng.choice(RISKY_CLAUSES if rng.random() < risky_share else NEUTRAL_CLAUSES)
+        if style == 'punctuated':
+            if rng.random() < 0.1:
+                piece = f"\n\n{section}. "
+                section += 1
+            else:
+                piece = ''
+            piece += clause + rng.choice(PUNCTUATION)
+        else:
+            piece = clause.lower().replace(',', '') + ' and '
+        parts.append(piece)
+        length += len(piece)
+
+    return ''.join(parts)[:size]
+
+
+def generate_corpus(sizes: Dict[str, int] = SIZES, seed: int = 0) -> Dict[str, str]:
+    """Every size in every style, keyed as '<style>-<size name>'"""
+    return {
+        f"{style}-{name}": generate_document(size, style, seed)
+        for style in STYLES
+        for name, size in sizes.items()
+    }
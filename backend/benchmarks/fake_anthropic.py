@@ -0,0 +1,221 @@
+"""
+Fake Anthropic Messages API
+A local stand-in for POST /v1/messages, so the Claude analysis path can be load-tested without the real API
+
+    python backend/benchmarks/fake_anthropic.py --port 8100 --latency lognormal:2.0:0.5 --error-rate 0.02
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8100 ANTHROPIC_API_KEY=fake uvicorn main:app
+
+Answers with canned analysis JSON (or the responses in --responses), after a
+latency drawn from the configured distribution, and streams it token by token
+when the request asks for a stream. A share of requests can be answered with
+the API's rate limit, overload and server errors instead.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Error status -> the API's error type for it
+ERROR_TYPES = {
+    429: 'rate_limit_error',
+    500: 'api_error',
+    529: 'overloaded_error'
+}
+
+# Roughly one token: a word with its trailing space, or a run of punctuation
+TOKEN_PATTERN = re.compile(r'\w+\s*|[^\w]+?\s*')
+
+
+def canned_analysis(prompt: str) -> Dict[str, Any]:
+    """Answer like Claude would, with a highlight for each "third parties" in the document part of the prompt"""
+    document = prompt.split("Document text: ", 1)[-1]
+    highlights = []
+    position = document.find("third parties")
+    while position != -1 and len(highlights) < 50:
+        highlights.append({
+            'start': position, 'end': position + 13, 'type': 'risky', 'confidence': 0.9,
+            'reason': 'Data sharing', 'category': 'privacy'
+        })
+        position = document.find("third parties", position + 13)
+    return {
+        'structured_text': document,
+        'highlights': highlights,
+        'issues': [{
+            'severity': 'warning', 'title': 'Data sharing', 'description': 'Shares personal data',
+            'location': 10.0, 'visual_priority': 7, 'action_required': True, 'compliance_issue': True,
+            'icon': 'shield', 'color': '#ef4444'
+        }],
+        'summary': {
+            'overall_risk': 'high', 'key_points': ['Shares data'], 'recommendations': ['Opt out'],
+            'word_count': len(document.split())
+        }
+    }
+
+
+def parse_latency(spec: str, rng: random.Random) -> Callable[[], float]:
+    """
+    A sampler for a latency spec in seconds: fixed:S, uniform:LOW:HIGH,
+    normal:MEAN:STDEV or lognormal:MEDIAN:SIGMA (long right tail, like real API latency)
+    """
+    kind, _, args = spec.partition(':')
+    values = [float(value) for value in args.split(':') if value]
+    samplers = {
+        'fixed': (1, lambda: values[0]),
+        'uniform': (2, lambda: rng.uniform(values[0], values[1])),
+        'normal': (2, lambda: rng.gauss(values[0], values[1])),
+        'lognormal': (2, lambda: values[0] * rng.lognormvariate(0.0, values[1]))
+    }
+    if kind not in samplers or len(values) != samplers[kind][0]:
+        raise ValueError(f"Invalid latency spec: {spec}")
+    sample = samplers[kind][1]
+    return lambda: max(sample(), 0.0)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(len(text) // 4, 1)
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def create_app(latency: Callable[[], float], error_rates: Dict[int, float], token_interval: float = 0.0,
+               responses: Optional[List[Dict[str, Any]]] = None, seed: int = 0) -> FastAPI:
+    """
+    The fake API. error_rates maps an HTTP status in ERROR_TYPES to the share
+    of requests answered with it; token_interval is the time per output token,
+    spent between stream events or added to the latency of a whole response.
+    """
+    app = FastAPI(title="Fake Anthropic Messages API")
+    rng = random.Random(seed)
+    canned = itertools.cycle(responses) if responses else None
+    stats = {'requests': 0, 'streams': 0, 'errors': {status: 0 for status in error_rates}}
+
+    def pick_error() -> Optional[int]:
+        roll = rng.random()
+        for status, rate in error_rates.items():
+            if roll < rate:
+                return status
+            roll -= rate
+        return None
+
+    @app.post("/v1/messages")
+    async def create_message(request: Request):
+        body = await request.json()
+        stats['requests'] += 1
+        prompt = ''.join(
+            message['content'] if isinstance(message['content'], str)
+            else ''.join(block.get('text', '') for block in message['content'])
+            for message in body.get('messages', [])
+        )
+        delay = latency()
+
+        status = pick_error()
+        if status is not None:
+            stats['errors'][status] += 1
+            await asyncio.sleep(delay)
+            return JSONResponse(
+                status_code=status,
+                content={'type': 'error', 'error': {'type': ERROR_TYPES[status], 'message': 'Fake upstream error'}}
+            )
+
+        analysis = next(canned) if canned else canned_analysis(prompt)
+        text = json.dumps(analysis, indent=2)
+        tokens = TOKEN_PATTERN.findall(text)
+        message = {
+            'id': f"msg_{uuid.uuid4().hex[:24]}",
+            'type': 'message',
+            'role': 'assistant',
+            'model': body.get('model', 'fake'),
+            'content': [],
+            'stop_reason': None,
+            'stop_sequence': None,
+            'usage': {'input_tokens': estimate_tokens(prompt), 'output_tokens': 0}
+        }
+
+        if not body.get('stream'):
+            await asyncio.sleep(delay + token_interval * len(tokens))
+            message['content'] = [{'type': 'text', 'text': text}]
+            message['stop_reason'] = 'end_turn'
+            message['usage']['output_tokens'] = len(tokens)
+            return JSONResponse(message)
+
+        stats['streams'] += 1
+
+        async def events():
+            # The latency is the time to the first token
+            await asyncio.sleep(delay)
+            yield _sse('message_start', {'type': 'message_start', 'message': message})
+            yield _sse('content_block_start', {
+                'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}
+            })
+            for token in tokens:
+                if token_interval:
+                    await asyncio.sleep(token_interval)
+                yield _sse('content_block_delta', {
+                    'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': token}
+                })
+            yield _sse('content_block_stop', {'type': 'content_block_stop', 'index': 0})
+            yield _sse('message_delta', {
+                'type': 'message_delta',
+                'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                'usage': {'output_tokens': len(tokens)}
+            })
+            yield _sse('message_stop', {'type': 'message_stop'})
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a fake Anthropic Messages API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", default="lognormal:1.5:0.4",
+                        help="time to the first token: fixed:S, uniform:LOW:HIGH, normal:MEAN:STDEV "
+                             "or lognormal:MEDIAN:SIGMA, in seconds (default lognormal:1.5:0.4)")
+    parser.add_argument("--token-interval", type=float, default=0.0,
+                        help="seconds per output token (default 0)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failing with 500")
+    parser.add_argument("--overload-rate", type=float, default=0.0, help="share of requests failing with 529")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests failing with 429")
+    parser.add_argument("--responses",
+                        help="JSON file with an analysis object, or a list of them answered in turn, "
+                             "instead of answers built from the prompt")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    responses = None
+    if args.responses:
+        loaded = json.loads(Path(args.responses).read_text())
+        responses = loaded if isinstance(loaded, list) else [loaded]
+
+    app = create_app(
+        latency=parse_latency(args.latency, rng),
+        error_rates={429: args.rate_limit_rate, 500: args.error_rate, 529: args.overload_rate},
+        token_interval=args.token_interval,
+        responses=responses,
+        seed=args.seed
+    )
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
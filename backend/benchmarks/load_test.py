@@ -0,0 +1,202 @@
+"""
+End-to-end load test
+
+    python backend/benchmarks/fake_anthropic.py --latency lognormal:2.0:0.5 &
+    cd backend && ANTHROPIC_BASE_URL=http://127.0.0.1:8100 ANTHROPIC_API_KEY=fake \\
+        RATE_LIMIT_ROUTES='{"/": [1000000000, 60]}' uvicorn main:app --port 8000 &
+    python backend/benchmarks/load_test.py --target http://127.0.0.1:8000 --concurrency 32 --duration 60
+
+Sends a weighted mix of /api/analyze, /api/dynamic-analyze and /api/analyze-file
+requests with corpus documents from a fixed number of concurrent clients, and
+reports the throughput and p50/p95/p99 latency of each endpoint. Documents get a
+unique first line so the result caches miss, except for the --cache-hit-share
+of requests that resend a document unchanged.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from corpus import SIZES, generate_corpus
+
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+# Default share of traffic per endpoint
+DEFAULT_MIX = "analyze=6,dynamic-analyze=3,analyze-file=1"
+ENDPOINTS = ('analyze', 'dynamic-analyze', 'analyze-file')
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def build_docx(text: str) -> bytes:
+    import docx
+    document = docx.Document()
+    for line in text.split('\n'):
+        document.add_paragraph(line)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    rank = max(int(round(q / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class LoadTest:
+    """Concurrent clients sending the request mix until the duration or request count runs out"""
+
+    def __init__(self, target: str, mix: Dict[str, float], corpus: Dict[str, str], concurrency: int,
+                 duration: float, requests: int, cache_hit_share: float, timeout: float, seed: int):
+        self.target = target.rstrip('/')
+        self.endpoints = list(mix)
+        self.weights = [mix[name] for name in self.endpoints]
+        self.corpus = corpus
+        self.concurrency = concurrency
+        self.duration = duration
+        self.requests = requests
+        self.cache_hit_share = cache_hit_share
+        self.timeout = timeout
+        self.seed = seed
+        self._sent = 0
+        # Per endpoint: (status or error name, seconds, degraded)
+        self.samples: Dict[str, List[Tuple[str, float, bool]]] = defaultdict(list)
+
+    def _document(self, rng: random.Random, sequence: int) -> str:
+        text = self.corpus[rng.choice(list(self.corpus))]
+        if rng.random() >= self.cache_hit_share:
+            return f"Agreement reference {self.seed}-{sequence}\n{text}"
+        return text
+
+    async def _request(self, endpoint: str, text: str) -> Tuple[str, Dict[str, Any]]:
+        """URL and body for a request; building uploads happens before the clock starts"""
+        if endpoint == 'analyze':
+            return f"{self.target}/api/analyze", {'json': {'text': text}}
+        if endpoint == 'dynamic-analyze':
+            return f"{self.target}/api/dynamic-analyze", {'json': {'text': text}}
+        upload = await asyncio.to_thread(build_docx, text)
+        return f"{self.target}/api/analyze-file", {'files': {'file': ('contract.docx', upload, DOCX_CONTENT_TYPE)}}
+
+    async def _client(self, client: httpx.AsyncClient, worker: int, deadline: float) -> None:
+        rng = random.Random(self.seed * 1000 + worker)
+        while time.monotonic() < deadline and (not self.requests or self._sent < self.requests):
+            self._sent += 1
+            endpoint = rng.choices(self.endpoints, self.weights)[0]
+            url, body = await self._request(endpoint, self._document(rng, self._sent))
+            start = time.perf_counter()
+            degraded = False
+            try:
+                response = await client.post(url, **body)
+                outcome = str(response.status_code)
+                if response.status_code == 200 and endpoint != 'analyze':
+                    degraded = bool(response.json().get('degraded'))
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            self.samples[endpoint].append((outcome, time.perf_counter() - start, degraded))
+
+    async def run(self) -> float:
+        """Run the clients and return the elapsed wall time"""
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits) as client:
+            start = time.monotonic()
+            deadline = start + self.duration if self.duration else float('inf')
+            await asyncio.gather(*[
+                self._client(client, worker, deadline) for worker in range(self.concurrency)
+            ])
+            return time.monotonic() - start
+
+    def report(self, elapsed: float) -> Dict[str, Dict[str, Any]]:
+        """Throughput and latency per endpoint, and over all requests"""
+        groups = dict(self.samples)
+        groups['all'] = [sample for name in self.samples for sample in self.samples[name]]
+        report = {}
+        for name, samples in groups.items():
+            ok = sorted(seconds for outcome, seconds, _ in samples if outcome == '200')
+            outcomes = defaultdict(int)
+            for outcome, _, _ in samples:
+                outcomes[outcome] += 1
+            report[name] = {
+                'requests': len(samples),
+                'ok': len(ok),
+                'degraded': sum(1 for outcome, _, degraded in samples if degraded),
+                'errors': {outcome: count for outcome, count in outcomes.items() if outcome != '200'},
+                'throughput_rps': len(ok) / elapsed if elapsed else 0.0,
+                'p50_ms': percentile(ok, 50) * 1000,
+                'p95_ms': percentile(ok, 95) * 1000,
+                'p99_ms': percentile(ok, 99) * 1000,
+                'max_ms': (ok[-1] if ok else 0.0) * 1000
+            }
+        return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load-test the analysis API with mixed traffic")
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="base URL of the API")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"endpoint weights (default {DEFAULT_MIX})")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run; 0 runs until --requests")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests; 0 for no limit")
+    parser.add_argument("--sizes", default="1kb,10kb", help=f"document sizes from {','.join(SIZES)}")
+    parser.add_argument("--cache-hit-share", type=float, default=0.0,
+                        help="share of requests resending a corpus document unchanged")
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds per request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report to this JSON file")
+    args = parser.parse_args()
+
+    if not args.duration and not args.requests:
+        parser.error("set --duration or --requests")
+
+    corpus = generate_corpus({name: SIZES[name] for name in args.sizes.split(',') if name}, args.seed)
+    test = LoadTest(args.target, parse_mix(args.mix), corpus, args.concurrency, args.duration,
+                    args.requests, args.cache_hit_share, args.timeout, args.seed)
+    elapsed = asyncio.run(test.run())
+    report = test.report(elapsed)
+
+    print(f"{report['all']['requests']} requests "
+          f"in {elapsed:.1f}s at concurrency {args.concurrency}\n")
+    print(f"{'endpoint':<17} {'ok':>6} {'errors':>7} {'degraded':>9} {'req/s':>8} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, row in report.items():
+        print(f"{name:<17} {row['ok']:>6} {sum(row['errors'].values()):>7} {row['degraded']:>9} "
+              f"{row['throughput_rps']:>8.2f} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+        if row['errors']:
+            print(f"{'':<17} errors: {json.dumps(row['errors'])}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({
+            'meta': {
+                'target': args.target, 'mix': parse_mix(args.mix), 'concurrency': args.concurrency,
+                'sizes': list(corpus), 'cache_hit_share': args.cache_hit_share,
+                'seed': args.seed, 'elapsed_s': elapsed
+            },
+            'results': report
+        }, indent=2))
+
+    return 0 if report['all']['ok'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""
+Analysis hot path benchmarks
+
+    python backend/benchmarks/run_benchmarks.py --output results.json
+    python backend/benchmarks/run_benchmarks.py --baseline results.json --threshold 0.2
+
+Times the pattern analysis functions and the FastAPI routes (with the Anthropic
+client stubbed) on the synthetic corpus, writes the timings as JSON and exits
+non-zero when any benchmark is slower than the baseline by more than the threshold.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+# Measure the work itself: no result caches, no rate limiting, no real API key
+os.environ.setdefault("ANALYSIS_CACHE_MAX_BYTES", "0")
+os.environ.setdefault("LLM_CACHE_PATH", "")
+os.environ.setdefault("RATE_LIMIT_ROUTES", json.dumps({"/": [10 ** 9, 60]}))
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+
+import logging
+
+from corpus import SIZES, generate_corpus
+from fake_anthropic import canned_analysis
+
+# Request bodies above the routes' input limits are rejected, so routes stop at 100 KB
+ROUTE_SIZES = ('1kb', '10kb', '100kb')
+
+# Highlight counts for the response serialization benchmarks
+SERIALIZE_HIGHLIGHTS = (10, 100, 1000)
+
+
+class _StubContent:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _StubMessage:
+    def __init__(self, text: str):
+        self.content = [_StubContent(text)]
+
+
+async def stub_create_message(prompt: str) -> _StubMessage:
+    """Answer like Claude would, without leaving the process"""
+    return _StubMessage(json.dumps(canned_analysis(prompt)))
+
+
+def measure(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """Per-call timings in milliseconds over repeat samples"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    samples = [t / number * 1000 for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        'median_ms': round(statistics.median(samples), 4),
+        'min_ms': round(min(samples), 4),
+        'calls_per_sample': number
+    }
+
+
+def build_benchmarks(corpus: Dict[str, str]) -> Dict[str, Callable[[], object]]:
+    import app
+    import dynamic_analyzer
+    from fastapi.testclient import TestClient
+    from pattern_engine import find_matches
+    from clause_selector import select_clauses
+    from stream_scanner import TopFlags, iter_chunks
+
+    dynamic_analyzer.analyzer._create_message = stub_create_message
+    app_client = TestClient(app.app)
+    dynamic_client = TestClient(dynamic_analyzer.app)
+
+    def stream_top_flags(text: str) -> list:
+        top = TopFlags(app.STREAM_MAX_PER_CATEGORY)
+        for flag in app.iter_red_flags(iter_chunks(text)):
+            top.add(flag)
+        return top.flags()
+
+    def post(client, path: str, body: dict):
+        def call():
+            response = client.post(path, json=body)
+            if response.status_code != 200:
+                raise RuntimeError(f"{path} returned {response.status_code}: {response.text[:200]}")
+        return call
+
+    benchmarks = {}
+    for name, text in corpus.items():
+        matches = [(match_text, text[max(start - 200, 0):end + 200])
+                   for _, start, end, match_text in find_matches(text)]
+
+        benchmarks[f"sanitize_text/{name}"] = lambda text=text: app.sanitize_text(text)
+        benchmarks[f"analyze_red_flags/{name}"] = lambda text=text: app.analyze_red_flags(text)
+        benchmarks[f"stream_red_flags/{name}"] = lambda text=text: stream_top_flags(text)
+        benchmarks[f"calculate_confidence/{name}"] = lambda matches=matches: [
+            app.calculate_confidence(match, context) for match, context in matches
+        ]
+        benchmarks[f"detect_document_type/{name}"] = (
+            lambda text=text: dynamic_analyzer.analyzer.detect_document_type(text)
+        )
+        benchmarks[f"select_clauses/{name}"] = lambda text=text: select_clauses(text)
+        benchmarks[f"generate_fallback_analysis/{name}"] = (
+            lambda text=text: dynamic_analyzer.analyzer._generate_fallback_analysis(text, 'legal_agreement')
+        )
+
+        if name.rsplit('-', 1)[-1] in ROUTE_SIZES:
+            benchmarks[f"route_analyze/{name}"] = post(app_client, "/api/analyze", {'text': text})
+            benchmarks[f"route_dynamic_analyze/{name}"] = post(
+                dynamic_client, "/api/dynamic-analyze", {'text': text, 'document_type': 'legal_agreement'}
+            )
+
+    benchmarks.update(build_serialization_benchmarks())
+    return benchmarks
+
+
+def build_serialization_benchmarks() -> Dict[str, Callable[[], object]]:
+    """Response encoding via FastAPI's response_model path versus FastJSONResponse"""
+    import dynamic_analyzer
+    from fast_json import FastJSONResponse
+    from fastapi.encoders import jsonable_encoder
+
+    benchmarks = {}
+    for count in SERIALIZE_HIGHLIGHTS:
+        response = dynamic_analyzer.DynamicAnalysisResponse(
+            structured_text="x" * (count * 40),
+            document_type='legal_agreement',
+            highlights=[{
+                'start': i * 40, 'end': i * 40 + 13, 'type': 'risky', 'confidence': 0.9,
+                'reason': 'Data sharing', 'category': 'privacy'
+            } for i in range(count)],
+            issues=[],
+            summary={'overall_risk': 'high', 'key_points': [], 'recommendations': [],
+                     'word_count': count, 'processing_time': 100},
+            visual_config={'color_scheme': {}, 'layout': {'type': 'standard'}}
+        )
+
+        def legacy(response=response):
+            # What FastAPI does for a returned model: revalidate, encode, dump
+            validated = dynamic_analyzer.DynamicAnalysisResponse.model_validate(response.model_dump())
+            return json.dumps(jsonable_encoder(validated)).encode()
+
+        benchmarks[f"serialize_legacy/{count}"] = legacy
+        benchmarks[f"serialize_fast/{count}"] = lambda response=response: FastJSONResponse(response).body
+    return benchmarks
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """Benchmarks whose median grew by more than threshold (a fraction) over the baseline"""
+    regressions = []
+    for name, result in sorted(results.items()):
+        previous = baseline.get(name)
+        if not previous or not previous.get('median_ms'):
+            continue
+        ratio = result['median_ms'] / previous['median_ms']
+        if ratio > 1 + threshold:
+            regressions.append(
+                f"{name}: {previous['median_ms']:.3f}ms -> {result['median_ms']:.3f}ms ({ratio - 1:+.0%})"
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the analysis hot paths")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results saved by an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed slowdown over the baseline as a fraction (default 0.2)")
+    parser.add_argument("--repeat", type=int, default=5, help="timing samples per benchmark")
+    parser.add_argument("--sizes", default=",".join(SIZES), help=f"comma-separated subset of {','.join(SIZES)}")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--seed", type=int, default=0, help="corpus seed")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    sizes = {name: SIZES[name] for name in args.sizes.split(",") if name}
+    corpus = generate_corpus(sizes, args.seed)
+    benchmarks = {
+        name: fn for name, fn in build_benchmarks(corpus).items() if args.filter in name
+    }
+
+    results = {}
+    for name, fn in benchmarks.items():
+        results[name] = measure(fn, args.repeat)
+        print(f"{name:<55} {results[name]['median_ms']:>12.3f} ms")
+
+    if args.output:
+        report = {
+            'meta': {
+                'timestamp': datetime.utcnow().isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'seed': args.seed,
+                'repeat': args.repeat
+            },
+            'results': results
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""
+Document chunking for map-reduce analysis
+Splits long documents on section or paragraph boundaries and merges per-chunk results
+"""
+
+from bisect import bisect_right
+from typing import Any, Dict, List, Tuple
+
+# Characters sent to the model per chunk
+MAX_CHUNK_CHARS = 15000
+# Characters repeated between neighbouring chunks so clauses on a cut are seen whole
+CHUNK_OVERLAP = 500
+
+RISK_ORDER = {'low': 0, 'medium': 1, 'high': 2}
+
+# Preferred cut points, best first: section break, line break, sentence end, word break
+_CUT_MARKERS = ('\n\n', '\n', '. ', ' ')
+
+
+def split_into_chunks(text: str, max_chars: int = MAX_CHUNK_CHARS,
+                      overlap: int = CHUNK_OVERLAP) -> List[Tuple[int, str]]:
+    """Split text into (offset, chunk) pairs of at most max_chars characters"""
+    if len(text) <= max_chars:
+        return [(0, text)]
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        limit = start + max_chars
+        if limit >= len(text):
+            chunks.append((start, text[start:]))
+            break
+
+        # Cut at the best boundary in the second half of the window
+        cut = limit
+        for marker in _CUT_MARKERS:
+            pos = text.rfind(marker, start + max_chars // 2, limit)
+            if pos != -1:
+                cut = pos + len(marker)
+                break
+        chunks.append((start, text[start:cut]))
+
+        # Start the next chunk on a boundary that keeps at least half the overlap
+        next_start = max(cut - overlap, start + 1)
+        for marker in _CUT_MARKERS:
+            pos = text.find(marker, next_start, cut - overlap // 2)
+            if pos != -1:
+                next_start = pos + len(marker)
+                break
+        start = next_start
+
+    return chunks
+
+
+def _dedupe(items: List[str]) -> List[str]:
+    seen = set()
+    unique = []
+    for item in items:
+        key = item.strip().lower()
+        if key not in seen:
+            seen.add(key)
+            unique.append(item)
+    return unique
+
+
+def shift_highlight(highlight: Dict[str, Any], offset: int, chunk_length: int) -> Dict[str, Any]:
+    """Clamp a chunk-relative highlight to its chunk and shift it into document coordinates"""
+    start = min(max(int(highlight.get('start', 0)), 0), chunk_length)
+    end = min(max(int(highlight.get('end', start)), start), chunk_length)
+    return {**highlight, 'start': offset + start, 'end': offset + end}
+
+
+def shift_issue(issue: Dict[str, Any], offset: int, chunk_length: int, text_length: int) -> Dict[str, Any]:
+    """Turn an issue location (a percentage through its chunk) into a percentage through the document"""
+    location = float(issue.get('location', 50.0))
+    global_location = (offset + location / 100 * chunk_length) / max(text_length, 1) * 100
+    return {**issue, 'location': round(min(max(global_location, 0.0), 100.0), 2)}
+
+
+def split_region_analysis(result: Dict[str, Any], lengths: List[int]) -> List[Dict[str, Any]]:
+    """
+    Divide the analysis of consecutive paragraphs into one chunk-style result per
+    paragraph. The region's summary stays with its first paragraph.
+    """
+    starts = []
+    total = 0
+    for length in lengths:
+        starts.append(total)
+        total += length
+
+    parts = [{
+        'highlights': [],
+        'issues': [],
+        'summary': {'overall_risk': 'low', 'key_points': [], 'recommendations': []}
+    } for _ in lengths]
+    if parts:
+        summary = result.get('summary', {})
+        parts[0]['summary'] = {
+            'overall_risk': summary.get('overall_risk', 'medium'),
+            'key_points': list(summary.get('key_points', [])),
+            'recommendations': list(summary.get('recommendations', []))
+        }
+
+    for h in result.get('highlights', []):
+        start = min(max(int(h.get('start', 0)), 0), total)
+        end = min(max(int(h.get('end', start)), start), total)
+        index = max(bisect_right(starts, start) - 1, 0)
+        # A highlight running into the next paragraph is cut at the boundary
+        # so that paragraph can change without leaving a stale span behind
+        local_end = min(end, starts[index] + lengths[index])
+        parts[index]['highlights'].append(
+            {**h, 'start': start - starts[index], 'end': local_end - starts[index]}
+        )
+
+    for issue in result.get('issues', []):
+        position = float(issue.get('location', 50.0)) / 100 * total
+        index = max(bisect_right(starts, position) - 1, 0)
+        local = (position - starts[index]) / max(lengths[index], 1) * 100
+        parts[index]['issues'].append({**issue, 'location': round(min(max(local, 0.0), 100.0), 2)})
+
+    return parts
+
+
+def merge_chunk_analyses(text: str, chunks: List[Tuple[int, str]],
+                         results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine per-chunk analyses into one, with offsets relative to the full text"""
+    highlights = []
+    issues = []
+    key_points = []
+    recommendations = []
+    overall_risk = 'low'
+
+    for (offset, chunk), result in zip(chunks, results):
+        for h in result.get('highlights', []):
+            highlights.append(shift_highlight(h, offset, len(chunk)))
+
+        for issue in result.get('issues', []):
+            issues.append(shift_issue(issue, offset, len(chunk), len(text)))
+
+        summary = result.get('summary', {})
+        key_points.extend(summary.get('key_points', []))
+        recommendations.extend(summary.get('recommendations', []))
+        risk = summary.get('overall_risk', 'medium')
+        if RISK_ORDER.get(risk, 1) > RISK_ORDER[overall_risk]:
+            overall_risk = risk if risk in RISK_ORDER else 'medium'
+
+    # Overlapping chunks report the same clause twice; keep the more confident one
+    highlights.sort(key=lambda h: (h['start'], h['end']))
+    merged_highlights = []
+    for h in highlights:
+        previous = merged_highlights[-1] if merged_highlights else None
+        if (previous and h['start'] < previous['end']
+                and h.get('type') == previous.get('type')
+                and h.get('category') == previous.get('category')):
+            if h.get('confidence', 0) > previous.get('confidence', 0):
+                merged_highlights[-1] = h
+            continue
+        merged_highlights.append(h)
+
+    merged_issues = []
+    seen_titles = set()
+    for issue in sorted(issues, key=lambda i: -i.get('visual_priority', 0)):
+        title = issue.get('title', '').strip().lower()
+        if title in seen_titles:
+            continue
+        seen_titles.add(title)
+        merged_issues.append(issue)
+
+    merged = {
+        # Chunk-level restructuring cannot be stitched back reliably, so offsets
+        # refer to the submitted text
+        'structured_text': text,
+        'highlights': merged_highlights,
+        'issues': merged_issues,
+        'summary': {
+            'overall_risk': overall_risk,
+            'key_points': _dedupe(key_points),
+            'recommendations': _dedupe(recommendations),
+            'word_count': len(text.split())
+        }
+    }
+    # Any chunk answered by the pattern fallback makes the whole analysis one
+    if any(result.get('fallback') for result in results):
+        merged['fallback'] = True
+    return merged
@@ -0,0 +1,159 @@
+"""
+Circuit breaker
+Stops calling a failing or slow upstream for a while and lets a few trial calls decide when to resume
+"""
+
+import contextlib
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Dict, Tuple
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the upstream while the circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Tracks the outcome and latency of the last window calls. Once at least
+    min_calls are recorded and either the failure rate or the share of calls
+    slower than slow_call_seconds reaches its threshold, the circuit opens
+    and calls are refused for open_seconds. It then half-opens: up to
+    half_open_probes trial calls go through, and the circuit closes once
+    that many succeed or opens again as soon as one fails.
+    """
+
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, failure_rate: float = 0.5,
+                 slow_call_seconds: float = 60.0, slow_call_rate: float = 0.8, open_seconds: float = 30.0,
+                 half_open_probes: int = 2, is_failure: Callable[[BaseException], bool] = lambda e: True,
+                 on_state_change: Callable[[str, str], None] = lambda name, state: None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.is_failure = is_failure
+        self.on_state_change = on_state_change
+        self._clock = clock
+        # (failed, slow) per recent call, oldest first
+        self._calls: Deque[Tuple[bool, bool]] = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        # Bumped on every transition so outcomes of calls from an earlier state are ignored
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._half_open_if_due()
+            return self._state
+
+    def allows_calls(self) -> bool:
+        """Whether a call would currently be let through, without reserving it"""
+        with self._lock:
+            self._half_open_if_due()
+            if self._state == HALF_OPEN:
+                return self._probes_in_flight < self.half_open_probes
+            return self._state == CLOSED
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            self._half_open_if_due()
+            calls = len(self._calls)
+            return {
+                'state': self._state,
+                'recent_calls': calls,
+                'failure_rate': round(sum(failed for failed, _ in self._calls) / calls, 3) if calls else 0.0,
+                'slow_call_rate': round(sum(slow for _, slow in self._calls) / calls, 3) if calls else 0.0
+            }
+
+    @contextlib.asynccontextmanager
+    async def guard(self, track_latency: bool = True) -> AsyncIterator[None]:
+        """
+        Run the with block as one upstream call, raising CircuitOpenError
+        instead when the circuit refuses it. Cancellation is not counted as
+        an outcome; exceptions count as failures when is_failure says so.
+        Streams whose duration depends on output length pass track_latency=False.
+        """
+        ticket = self._acquire()
+        start = self._clock()
+        try:
+            yield
+        except BaseException as e:
+            if isinstance(e, Exception):
+                self._record(ticket, self.is_failure(e), False)
+            else:
+                self._release(ticket)
+            raise
+        slow = track_latency and self._clock() - start >= self.slow_call_seconds
+        self._record(ticket, False, slow)
+
+    def _half_open_if_due(self) -> None:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN)
+
+    def _acquire(self) -> Tuple[int, bool]:
+        """Reserve a call, returning its generation and whether it is a half-open probe"""
+        with self._lock:
+            self._half_open_if_due()
+            if self._state == CLOSED:
+                return self._generation, False
+            if self._state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return self._generation, True
+        raise CircuitOpenError(f"Circuit '{self.name}' is open")
+
+    def _release(self, ticket: Tuple[int, bool]) -> None:
+        generation, probe = ticket
+        with self._lock:
+            if probe and generation == self._generation:
+                self._probes_in_flight -= 1
+
+    def _record(self, ticket: Tuple[int, bool], failed: bool, slow: bool) -> None:
+        generation, probe = ticket
+        with self._lock:
+            if generation != self._generation:
+                # The call started before the last transition; its outcome is stale
+                return
+            if probe:
+                self._probes_in_flight -= 1
+                if failed or slow:
+                    self._open()
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._calls.clear()
+                    self._transition(CLOSED)
+                return
+
+            self._calls.append((failed, slow))
+            calls = len(self._calls)
+            if calls < self.min_calls:
+                return
+            failures = sum(f for f, _ in self._calls)
+            slow_calls = sum(s for _, s in self._calls)
+            if failures / calls >= self.failure_rate or slow_calls / calls >= self.slow_call_rate:
+                self._open()
+
+    def _open(self) -> None:
+        self._opened_at = self._clock()
+        self._calls.clear()
+        self._transition(OPEN)
+
+    def _transition(self, state: str) -> None:
+        self._state = state
+        self._generation += 1
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self.on_state_change(self.name, state)
@@ -0,0 +1,192 @@
+"""
+Clause pre-selection
+Picks the paragraphs the pattern scan flags as most likely to matter, packs them into a token budget
+for the model and maps the model's offsets back onto the full document
+"""
+
+import os
+from bisect import bisect_right
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from chunking import MAX_CHUNK_CHARS
+from delta import PARAGRAPH_MAX_CHARS, split_paragraphs
+from pattern_engine import RED_FLAG_PATTERNS, find_matches
+
+# Rough size of a token in English legal text
+CHARS_PER_TOKEN = 4
+# Prompt budget for the selected clauses, one chunk by default; documents that fit are sent
+# whole, and 0 turns selection off so long documents are analyzed chunk by chunk
+CLAUSE_SELECTION_TOKENS = int(os.getenv("CLAUSE_SELECTION_TOKENS", str(MAX_CHUNK_CHARS // CHARS_PER_TOKEN)))
+# Opening paragraphs always sent, since they usually name the parties and the agreement
+LEAD_PARAGRAPHS = 1
+# Short paragraphs are scored as if they were this long, so a lone keyword does not dominate
+MIN_SCORED_CHARS = 200
+
+SEVERITY_WEIGHTS = {'high': 3.0, 'medium': 2.0, 'low': 1.0}
+
+
+def _marker(offset: int) -> str:
+    return f"[@{offset}]\n"
+
+
+class ClauseSelection:
+    """
+    The chosen paragraphs of a document as one excerpt, each run of adjacent
+    paragraphs preceded by an [@offset] marker with its position in the full
+    text. Offsets into the excerpt map back exactly to offsets into the text.
+    """
+
+    def __init__(self, text: str, segments: List[Tuple[int, int]], paragraphs: int, selected: int):
+        self.text = text
+        self.paragraphs = paragraphs
+        self.selected = selected
+        # Per segment: where its text starts in the excerpt and in the document, and its length
+        self._excerpt_starts: List[int] = []
+        self._source_starts: List[int] = []
+        self._lengths: List[int] = []
+
+        parts = []
+        position = 0
+        for start, end in segments:
+            marker = _marker(start)
+            parts.append(marker)
+            parts.append(text[start:end])
+            position += len(marker)
+            self._excerpt_starts.append(position)
+            self._source_starts.append(start)
+            self._lengths.append(end - start)
+            position += end - start
+        self.excerpt = ''.join(parts)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'paragraphs': self.paragraphs,
+            'selected_paragraphs': self.selected,
+            'document_chars': len(self.text),
+            'excerpt_chars': len(self.excerpt)
+        }
+
+    def _segment(self, offset: int) -> int:
+        return max(bisect_right(self._excerpt_starts, offset) - 1, 0)
+
+    def to_source(self, offset: int) -> int:
+        """Document offset for an excerpt offset; offsets inside a marker snap to its segment"""
+        index = self._segment(offset)
+        local = min(max(offset - self._excerpt_starts[index], 0), self._lengths[index])
+        return self._source_starts[index] + local
+
+    def to_source_span(self, start: int, end: int) -> Tuple[int, int]:
+        """Document span for an excerpt span, cut at the end of the segment it starts in"""
+        index = self._segment(start)
+        source_start = self.to_source(start)
+        segment_end = self._source_starts[index] + self._lengths[index]
+        return source_start, min(max(self.to_source(end), source_start), segment_end)
+
+    def map_analysis(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Rewrite an analysis of the excerpt into one of the full document"""
+        highlights = []
+        for h in result.get('highlights', []):
+            start, end = self.to_source_span(int(h.get('start', 0)), int(h.get('end', 0)))
+            highlights.append({**h, 'start': start, 'end': end})
+
+        issues = []
+        for issue in result.get('issues', []):
+            position = float(issue.get('location', 50.0)) / 100 * len(self.excerpt)
+            location = self.to_source(int(position)) / max(len(self.text), 1) * 100
+            issues.append({**issue, 'location': round(min(max(location, 0.0), 100.0), 2)})
+
+        return {
+            **result,
+            # The model only saw excerpts, so its restructured text cannot stand in for the document
+            'structured_text': self.text,
+            'highlights': sorted(highlights, key=lambda h: (h['start'], h['end'])),
+            'issues': issues,
+            'summary': {**result.get('summary', {}), 'word_count': len(self.text.split())}
+        }
+
+
+def split_clauses(text: str, max_chars: int = PARAGRAPH_MAX_CHARS) -> List[Tuple[int, str]]:
+    """Non-blank paragraphs as (offset, paragraph), with unpunctuated runs cut at word breaks"""
+    clauses = []
+    for offset, paragraph in split_paragraphs(text, max_chars):
+        while len(paragraph) > max_chars:
+            cut = paragraph.rfind(' ', max_chars // 2, max_chars) + 1 or max_chars
+            clauses.append((offset, paragraph[:cut]))
+            offset += cut
+            paragraph = paragraph[cut:]
+        clauses.append((offset, paragraph))
+    return [(offset, paragraph) for offset, paragraph in clauses if paragraph.strip()]
+
+
+def score_paragraphs(text: str, paragraphs: List[Tuple[int, str]]) -> Tuple[List[float], List[Dict[str, int]]]:
+    """
+    Severity-weighted red flag matches per character for each paragraph, and
+    the patterns each paragraph matches, from a single scan of the whole text
+    """
+    starts = [offset for offset, _ in paragraphs]
+    weights = [0.0] * len(paragraphs)
+    patterns: List[Dict[str, int]] = [defaultdict(int) for _ in paragraphs]
+    for name, start, _, _ in find_matches(text):
+        index = max(bisect_right(starts, start) - 1, 0)
+        weights[index] += SEVERITY_WEIGHTS.get(RED_FLAG_PATTERNS[name]['severity'], 1.0)
+        patterns[index][name] += 1
+    scores = [weight / max(len(paragraph), MIN_SCORED_CHARS)
+              for weight, (_, paragraph) in zip(weights, paragraphs)]
+    return scores, patterns
+
+
+def select_clauses(text: str, token_budget: int = CLAUSE_SELECTION_TOKENS) -> Optional[ClauseSelection]:
+    """
+    Choose paragraphs for a budget of token_budget tokens, or None when the
+    whole text fits. After the opening paragraphs, the densest paragraph for
+    each matched pattern goes in (most severe patterns first) so every kind of
+    red flag is represented, then the remaining flagged paragraphs by density.
+    """
+    budget = token_budget * CHARS_PER_TOKEN
+    if not token_budget or len(text) <= budget:
+        return None
+
+    paragraphs = split_clauses(text)
+    scores, patterns = score_paragraphs(text, paragraphs)
+    chosen = set()
+    used = 0
+
+    def take(index: int) -> None:
+        nonlocal used
+        cost = len(paragraphs[index][1]) + len(_marker(paragraphs[index][0]))
+        if index not in chosen and used + cost <= budget:
+            chosen.add(index)
+            used += cost
+
+    for index in range(min(LEAD_PARAGRAPHS, len(paragraphs))):
+        take(index)
+
+    by_density = sorted((i for i, score in enumerate(scores) if score > 0), key=lambda i: -scores[i])
+    matched = {name for found in patterns for name in found}
+    severities = {name: SEVERITY_WEIGHTS.get(RED_FLAG_PATTERNS[name]['severity'], 1.0) for name in matched}
+    # Ties broken by name so the same text always yields the same excerpt (and cache key)
+    for name in sorted(matched, key=lambda name: (-severities[name], name)):
+        for index in by_density:
+            if name in patterns[index]:
+                take(index)
+                break
+    for index in by_density:
+        take(index)
+
+    if not by_density:
+        # Nothing flagged; send the document from the top as far as the budget goes
+        for index in range(len(paragraphs)):
+            take(index)
+    if not chosen:
+        return None
+
+    # Adjacent paragraphs share one marker
+    segments: List[Tuple[int, int]] = []
+    for index in sorted(chosen):
+        offset, paragraph = paragraphs[index]
+        if segments and segments[-1][1] == offset:
+            segments[-1] = (segments[-1][0], offset + len(paragraph))
+        else:
+            segments.append((offset, offset + len(paragraph)))
+    return ClauseSelection(text, segments, len(paragraphs), len(chosen))
@@ -0,0 +1,103 @@
+"""
+Delta re-analysis
+Remembers the last version of each client document by paragraph so only edited paragraphs are analyzed again
+"""
+
+import os
+import re
+from difflib import SequenceMatcher
+from typing import Any, List, Optional, Tuple
+
+from result_cache import ResultCache, estimate_size
+
+DELTA_CACHE_MAX_BYTES = int(os.getenv("DELTA_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+DELTA_CACHE_TTL = float(os.getenv("DELTA_CACHE_TTL", "86400"))  # seconds
+# Paragraphs longer than this are split further at sentence ends
+PARAGRAPH_MAX_CHARS = int(os.getenv("DELTA_PARAGRAPH_MAX_CHARS", "2000"))
+
+# A line with its trailing newlines, or a run of bare newlines
+_BLOCK = re.compile(r'[^\n]+\n*|\n+')
+# A sentence with its trailing whitespace, or an unterminated tail
+_SENTENCE = re.compile(r'[^.!?]*[.!?]+\s*|[^.!?]+')
+
+
+def split_paragraphs(text: str, max_chars: int = PARAGRAPH_MAX_CHARS) -> List[Tuple[int, str]]:
+    """
+    Split text into (offset, paragraph) pairs that concatenate back to the text.
+    Boundaries depend only on nearby content, so an edit does not move the
+    paragraphs around it.
+    """
+    paragraphs = []
+    for block in _BLOCK.finditer(text):
+        if block.end() - block.start() <= max_chars:
+            paragraphs.append((block.start(), block.group()))
+            continue
+        # Group sentences of an overlong line into pieces of up to max_chars
+        piece_start = block.start()
+        for sentence in _SENTENCE.finditer(text, block.start(), block.end()):
+            if sentence.end() - piece_start > max_chars and sentence.start() > piece_start:
+                paragraphs.append((piece_start, text[piece_start:sentence.start()]))
+                piece_start = sentence.start()
+        paragraphs.append((piece_start, text[piece_start:block.end()]))
+    return paragraphs
+
+
+class DeltaPlan:
+    """The paragraphs of a new version, with results carried over from the previous one"""
+
+    def __init__(self, paragraphs: List[Tuple[int, str]], results: List[Optional[Any]]):
+        self.paragraphs = paragraphs
+        # None marks a paragraph that is new or changed and must be analyzed
+        self.results = results
+        self.reused = sum(result is not None for result in results)
+
+    @property
+    def pending(self) -> List[int]:
+        return [i for i, result in enumerate(self.results) if result is None]
+
+    def pending_runs(self) -> List[Tuple[int, int]]:
+        """Consecutive pending paragraphs as [first, last + 1) index ranges"""
+        runs = []
+        for i in self.pending:
+            if runs and runs[-1][1] == i:
+                runs[-1] = (runs[-1][0], i + 1)
+            else:
+                runs.append((i, i + 1))
+        return runs
+
+    def stats(self) -> dict:
+        return {
+            'paragraphs': len(self.paragraphs),
+            'reused_paragraphs': self.reused,
+            'analyzed_paragraphs': len(self.paragraphs) - self.reused
+        }
+
+
+class DocumentVersionStore:
+    """Per-paragraph results of the latest analyzed version of each document"""
+
+    def __init__(self, max_bytes: int = DELTA_CACHE_MAX_BYTES, ttl: float = DELTA_CACHE_TTL):
+        self._versions = ResultCache(max_bytes, ttl)
+
+    def plan(self, key: str, text: str) -> DeltaPlan:
+        """Diff text against the stored version and reuse the results of unchanged paragraphs"""
+        paragraphs = split_paragraphs(text)
+        results: List[Optional[Any]] = [None] * len(paragraphs)
+
+        previous = self._versions.get(key)
+        if previous is not None:
+            old_texts, old_results = previous
+            new_texts = [paragraph for _, paragraph in paragraphs]
+            matcher = SequenceMatcher(None, old_texts, new_texts, autojunk=False)
+            for old_start, new_start, size in matcher.get_matching_blocks():
+                results[new_start:new_start + size] = old_results[old_start:old_start + size]
+        return DeltaPlan(paragraphs, results)
+
+    def commit(self, key: str, plan: DeltaPlan) -> None:
+        """Store the fully analyzed plan as the document's latest version"""
+        texts = [paragraph for _, paragraph in plan.paragraphs]
+        size = sum(49 + len(paragraph) for paragraph in texts) + estimate_size(plan.results)
+        self._versions.put(key, (texts, plan.results), size=size)
+
+    def stats(self) -> dict:
+        return self._versions.stats()
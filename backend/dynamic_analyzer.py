@@ -3,30 +3,155 @@ Dynamic Document Analysis API
 Replaces the old DeBERTa/Legal-BERT approach with Claude API integration
 """
 
-from fastapi import FastAPI, HTTPException, Depends, File, UploadFile
+from fastapi import FastAPI, HTTPException, Depends, File, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import List, Dict, Optional, Any
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field, TypeAdapter
+from typing import List, Dict, Literal, Optional, Any, AsyncIterator, Tuple
 import asyncio
+import contextlib
 import time
 import logging
-import re
+import json
+import sys
 from datetime import datetime
-import anthropic
+from io import BytesIO
 import os
 from pathlib import Path
-import PyPDF2
-import docx
-from io import BytesIO
+from chunking import (
+    CHUNK_OVERLAP, MAX_CHUNK_CHARS, merge_chunk_analyses, shift_highlight, shift_issue, split_into_chunks,
+    split_region_analysis
+)
+from json_stream import IncrementalArrayParser
+from clause_selector import ClauseSelection, select_clauses
+from rule_engine import get_engine
+from llm_cache import LLMResponseCache
+from delta import DeltaPlan, DocumentVersionStore
+from result_cache import content_key
+from extraction import (
+    extract_docx, extract_pdf, page_for_offset, shutdown_extraction_pool, spool_to_disk
+)
+from request_limits import BodySizeLimitMiddleware
+from fast_json import FastJSONResponse
+from type_detector import detect_type
+from warmup import warm_up
+from singleflight import SingleFlight
+from jobs import FAILED, SUCCEEDED, JobQueue, JobQueueFullError, JobStore
+from circuit_breaker import CLOSED, HALF_OPEN, CircuitBreaker, CircuitOpenError
+from metrics import (
+    CIRCUIT_STATE, CIRCUIT_TRANSITIONS, CONTENT_TYPE, FALLBACKS, LLM_HEDGES, LLM_REQUESTS, OVERLOAD_REJECTIONS,
+    PARSE_FAILURES, REGISTRY, STAGE_SECONDS, record_llm_usage
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Anthropic client
-anthropic_client = anthropic.Anthropic(
-    api_key=os.getenv("ANTHROPIC_API_KEY")
-)
+# Upstream concurrency and backpressure
+ANTHROPIC_MAX_CONCURRENCY = int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", "32"))
+ANTHROPIC_QUEUE_TIMEOUT = float(os.getenv("ANTHROPIC_QUEUE_TIMEOUT", "5"))  # seconds waiting for a slot
+ANTHROPIC_REQUEST_TIMEOUT = float(os.getenv("ANTHROPIC_REQUEST_TIMEOUT", "120"))  # seconds
+ANTHROPIC_MAX_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_CONNECTIONS", "100"))
+# Messages API endpoint; point at benchmarks/fake_anthropic.py to load-test without the real API
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL") or None
+
+# Circuit breaker around Claude calls; while it is open, requests get the
+# pattern fallback straight away instead of waiting on a failing upstream
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "90"))  # seconds per non-streaming call
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "20"))  # recent calls considered
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "45"))
+CIRCUIT_SLOW_CALL_RATE = float(os.getenv("CIRCUIT_SLOW_CALL_RATE", "0.8"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "2"))
+# Start a duplicate call when the first has not answered after this many
+# seconds and use whichever finishes first; 0 disables hedging
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "0"))
+
+# Chunks of one document analyzed at the same time
+CHUNK_CONCURRENCY = int(os.getenv("CHUNK_CONCURRENCY", "8"))
+
+# How often a waiting request checks whether its client went away
+DISCONNECT_POLL_INTERVAL = 0.5  # seconds
+
+# Largest accepted file upload, and largest body for every other route
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+ANALYZE_MAX_BODY_BYTES = int(os.getenv("ANALYZE_MAX_BODY_BYTES", str(4 * 1024 * 1024)))
+
+# Body limits for the upload routes
+UPLOAD_BODY_LIMITS = {"/api/analyze-file": MAX_UPLOAD_BYTES, "/api/jobs/analyze-file": MAX_UPLOAD_BYTES}
+
+_anthropic_client = None
+
+def get_anthropic_client():
+    """
+    One pooled async client per worker so connections are reused across
+    requests. Created on first use: the SDK and its HTTP stack take longer to
+    import than the rest of the service, and pattern-only workers never need them.
+    """
+    global _anthropic_client
+    if _anthropic_client is None:
+        import anthropic
+        import httpx
+
+        _anthropic_client = anthropic.AsyncAnthropic(
+            api_key=os.getenv("ANTHROPIC_API_KEY"),
+            base_url=ANTHROPIC_BASE_URL,
+            timeout=ANTHROPIC_REQUEST_TIMEOUT,
+            http_client=anthropic.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=ANTHROPIC_MAX_CONNECTIONS,
+                    max_keepalive_connections=ANTHROPIC_MAX_CONNECTIONS
+                )
+            )
+        )
+    return _anthropic_client
+
+CLAUDE_MODEL = 'claude-3-5-sonnet-20241022'
+# Added to the prompt when the document text is a set of selected clauses
+EXCERPT_PROMPT_NOTE = """
+The document text is a selection of clauses from a longer document. Each run of
+clauses starts on a line like [@1234] giving its character position in the full
+document. Report highlight start and end as character offsets into the document
+text below, counting the marker lines, and issue locations as a percentage through it.
+"""
+# Bump whenever the analysis prompt changes so cached responses are not reused
+PROMPT_TEMPLATE_VERSION = "1"
+
+# Persistent response cache shared by every worker; set LLM_CACHE_PATH="" to disable
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", str(Path(__file__).parent / "cache" / "llm_responses.sqlite3"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+response_cache = LLMResponseCache(LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES) if LLM_CACHE_PATH else None
+
+# Background jobs; state lives in SQLite so queued work survives a restart
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", str(Path(__file__).parent / "cache" / "jobs.sqlite3"))
+JOB_UPLOAD_DIR = os.getenv("JOB_UPLOAD_DIR", str(Path(__file__).parent / "cache" / "job_uploads"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "1000"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", str(24 * 3600)))  # seconds
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "30"))  # longest long-poll, seconds
+
+class AnalyzerOverloadedError(Exception):
+    """Raised when a request waits too long for an upstream slot"""
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """Whether an error says the upstream is unhealthy rather than that the request was bad"""
+    import anthropic
+
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code >= 500 or error.status_code == 429
+    return True
+
+CIRCUIT_STATE_VALUES = {CLOSED: 0.0, HALF_OPEN: 0.5}
+
+def log_circuit_change(name: str, state: str) -> None:
+    logger.warning(f"Circuit '{name}' is now {state}")
+    CIRCUIT_STATE.set(CIRCUIT_STATE_VALUES.get(state, 1.0), circuit=name)
+    CIRCUIT_TRANSITIONS.inc(circuit=name, state=state)
 
 # Pydantic models
 class DocumentHighlight(BaseModel):
@@ -36,6 +161,7 @@ class DocumentHighlight(BaseModel):
     confidence: float = Field(..., ge=0.0, le=1.0)
     reason: str
     category: str
+    page: Optional[int] = None
 
 class DocumentIssue(BaseModel):
     severity: str = Field(..., description="critical, warning, or info")
@@ -66,20 +192,41 @@ class DynamicAnalysisResponse(BaseModel):
     issues: List[DocumentIssue]
     summary: AnalysisSummary
     visual_config: VisualConfig
+    pages: Optional[List[Dict[str, int]]] = None
+    delta: Optional[Dict[str, int]] = None
+    # Answered by the pattern fallback because Claude was unavailable
+    degraded: bool = False
+
+# Validate model output lists in one call instead of one model per item
+HIGHLIGHTS_ADAPTER = TypeAdapter(List[DocumentHighlight])
+ISSUES_ADAPTER = TypeAdapter(List[DocumentIssue])
+
+def validate_analysis(analysis_data: Any) -> dict:
+    """Check a parsed reply has the shape of an analysis; raises ValueError if not"""
+    if not isinstance(analysis_data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(analysis_data).__name__}")
+    for key in ('highlights', 'issues', 'summary'):
+        if key not in analysis_data:
+            raise ValueError(f"Missing '{key}'")
+    HIGHLIGHTS_ADAPTER.validate_python(analysis_data['highlights'])
+    ISSUES_ADAPTER.validate_python(analysis_data['issues'])
+    if not isinstance(analysis_data['summary'], dict):
+        raise ValueError("'summary' is not an object")
+    AnalysisSummary.model_validate({**analysis_data['summary'], 'processing_time': 0})
+    return analysis_data
 
 class AnalyzeRequest(BaseModel):
     text: str = Field(..., max_length=500000)
     filename: Optional[str] = None
     document_type: Optional[str] = None
+    # Client-chosen ID; resubmissions only re-analyze the paragraphs that changed
+    document_id: Optional[str] = Field(None, max_length=256)
 
-# Document type detection patterns
-DOCUMENT_TYPE_PATTERNS = {
-    'legal_agreement': r'agreement|contract|terms|parties|whereas|hereby|shall|party|clause|provision',
-    'financial_report': r'revenue|profit|financial|quarter|fiscal|earnings|balance|income|cash flow',
-    'policy_document': r'policy|procedure|guidelines|compliance|standard|regulation|requirement',
-    'technical_spec': r'specification|requirements|architecture|design|implementation|technical|system',
-    'employment_contract': r'employment|employee|employer|salary|benefits|termination|duties|responsibilities',
-    'lease_agreement': r'lease|rental|tenant|landlord|property|premises|rent|security deposit'
+# Highlight type for each constitutional severity in the pattern fallback
+CONSTITUTION_HIGHLIGHT_TYPES = {
+    'CRITICAL': 'risky',
+    'HIGH': 'risky',
+    'MEDIUM': 'attention'
 }
 
 # Color schemes for different document types
@@ -113,24 +260,122 @@ DOCUMENT_COLOR_SCHEMES = {
 class DynamicDocumentAnalyzer:
     """Main analyzer class using Claude API"""
     
-    def __init__(self):
-        self.client = anthropic_client
+    def __init__(self, cache: Optional[LLMResponseCache] = None,
+                 max_concurrency: int = ANTHROPIC_MAX_CONCURRENCY,
+                 queue_timeout: float = ANTHROPIC_QUEUE_TIMEOUT,
+                 breaker: Optional[CircuitBreaker] = None):
+        self._client = None
+        self.cache = cache
+        self.queue_timeout = queue_timeout
+        self._upstream_slots = asyncio.Semaphore(max_concurrency)
+        self.versions = DocumentVersionStore()
+        # Identical documents analyzed at the same time share one set of Claude calls
+        self._in_flight = SingleFlight('analyze_document')
+        self.breaker = breaker or CircuitBreaker(
+            'anthropic',
+            window=CIRCUIT_WINDOW,
+            min_calls=CIRCUIT_MIN_CALLS,
+            failure_rate=CIRCUIT_FAILURE_RATE,
+            slow_call_seconds=CIRCUIT_SLOW_CALL_SECONDS,
+            slow_call_rate=CIRCUIT_SLOW_CALL_RATE,
+            open_seconds=CIRCUIT_OPEN_SECONDS,
+            half_open_probes=CIRCUIT_HALF_OPEN_PROBES,
+            is_failure=is_upstream_failure,
+            on_state_change=log_circuit_change
+        )
     
-    def detect_document_type(self, text: str, filename: str = "") -> str:
-        """Detect document type using pattern matching"""
-        scores = {}
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_anthropic_client()
+        return self._client
+    
+    @client.setter
+    def client(self, client):
+        self._client = client
+    
+    @contextlib.asynccontextmanager
+    async def _upstream_slot(self):
+        """Hold one upstream concurrency slot, rejecting fast if none frees up in time"""
+        try:
+            await asyncio.wait_for(self._upstream_slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise AnalyzerOverloadedError(
+                f"No analysis slot became free within {self.queue_timeout:g}s"
+            )
         
-        for doc_type, pattern in DOCUMENT_TYPE_PATTERNS.items():
-            matches = len(re.findall(pattern, text, re.IGNORECASE))
-            scores[doc_type] = matches
-            
-            # Boost score if filename suggests type
-            if filename and doc_type.replace('_', '') in filename.lower():
-                scores[doc_type] += 5
+        try:
+            yield
+        finally:
+            self._upstream_slots.release()
+    
+    async def _call_claude(self, prompt: str):
+        """Call Claude once a concurrency slot is free, through the circuit breaker"""
+        if not self.breaker.allows_calls():
+            raise CircuitOpenError(f"Circuit '{self.breaker.name}' is open")
+        async with self._upstream_slot(), self.breaker.guard():
+            # Cancelling this coroutine closes the upstream HTTP request
+            try:
+                with STAGE_SECONDS.time(stage='llm_call'):
+                    response = await asyncio.wait_for(self.client.messages.create(
+                        model=CLAUDE_MODEL,
+                        max_tokens=4000,
+                        temperature=0.1,
+                        messages=[{
+                            'role': 'user',
+                            'content': prompt
+                        }]
+                    ), timeout=LLM_CALL_TIMEOUT)
+            except asyncio.TimeoutError:
+                LLM_REQUESTS.inc(model=CLAUDE_MODEL, outcome='timeout')
+                raise
+            except Exception:
+                LLM_REQUESTS.inc(model=CLAUDE_MODEL, outcome='error')
+                raise
+            LLM_REQUESTS.inc(model=CLAUDE_MODEL, outcome='ok')
+            record_llm_usage(CLAUDE_MODEL, getattr(response, 'usage', None))
+            return response
+    
+    async def _create_message(self, prompt: str):
+        """
+        Call Claude, hedging when enabled: if no answer arrives within
+        LLM_HEDGE_AFTER seconds a second identical call starts, the first to
+        succeed wins and the other is cancelled.
+        """
+        if LLM_HEDGE_AFTER <= 0:
+            return await self._call_claude(prompt)
         
-        # Return type with highest score
-        best_type = max(scores, key=scores.get) if scores else 'legal_agreement'
-        return best_type
+        primary = asyncio.ensure_future(self._call_claude(prompt))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=LLM_HEDGE_AFTER)
+            # Hedging spends tokens; don't add load while the circuit is probing
+            if done or self.breaker.state != CLOSED:
+                return await primary
+            
+            hedge = asyncio.ensure_future(self._call_claude(prompt))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.exception():
+                        LLM_HEDGES.inc(winner='primary' if task is primary else 'hedge')
+                        return task.result()
+            # Both failed; report the original call's error
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def detect_document_type(self, text: str, filename: str = "") -> str:
+        """Detect document type from keyword frequencies"""
+        with STAGE_SECONDS.time(stage='type_detection'):
+            detection = detect_type(text, filename)
+        logger.info(
+            f"Detected {detection.document_type} document "
+            f"(confidence {detection.confidence:.2f}{', sampled' if detection.sampled else ''})"
+        )
+        return detection.document_type
     
     def generate_color_scheme(self, document_type: str, risk_level: str) -> dict:
         """Generate color scheme for document type"""
@@ -170,11 +415,10 @@ class DynamicDocumentAnalyzer:
             'highlightDensity': 'compact' if highlights_count > 50 else 'spacious'
         }
     
-    async def analyze_document(self, text: str, document_type: str, filename: str = "") -> DynamicAnalysisResponse:
-        """Main analysis method using Claude"""
-        start_time = time.time()
-        
-        analysis_prompt = f"""
+    def _build_prompt(self, text: str, document_type: str, excerpt: bool = False) -> str:
+        """Build the analysis prompt for one chunk of text, or for selected clauses"""
+        excerpt_note = EXCERPT_PROMPT_NOTE if excerpt else ""
+        return f"""
 Analyze this {document_type.replace('_', ' ')} document and return a JSON response with the following structure:
 
 {{
@@ -216,107 +460,388 @@ Focus on:
 3. Noting items requiring attention (yellow highlights)
 4. Providing actionable insights and recommendations
 5. Detecting compliance issues and legal risks
-
-Document text: {text[:15000]}
+{excerpt_note}
+Document text: {text}
 """
-
+    
+    def _cache_key(self, text: str, document_type: str, excerpt: bool = False) -> str:
+        parts = (document_type, 'excerpt') if excerpt else (document_type,)
+        return LLMResponseCache.make_key(CLAUDE_MODEL, PROMPT_TEMPLATE_VERSION, text, *parts)
+    
+    async def is_cached(self, text: str, document_type: str) -> bool:
+        """Whether every chunk of the document already has a cached analysis"""
+        if not self.cache:
+            return False
+        # Clause selection scans the whole text and the cache is SQLite shared with other
+        # workers; this runs while the circuit is open, when the loop must stay responsive
+        return await asyncio.to_thread(self._is_cached, text, document_type)
+    
+    def _is_cached(self, text: str, document_type: str) -> bool:
+        selection = self._select_clauses(text)
+        if selection is not None:
+            return self.cache.contains(self._cache_key(selection.excerpt, document_type, excerpt=True))
+        return all(
+            self.cache.contains(self._cache_key(chunk, document_type))
+            for _, chunk in split_into_chunks(text, MAX_CHUNK_CHARS, CHUNK_OVERLAP)
+        )
+    
+    @staticmethod
+    def _select_clauses(text: str) -> Optional[ClauseSelection]:
+        """Selected clauses of a document longer than one chunk; shorter ones are always sent whole"""
+        if len(text) <= MAX_CHUNK_CHARS:
+            return None
+        return select_clauses(text)
+    
+    async def _analyze_chunk(self, text: str, document_type: str, excerpt: bool = False) -> dict:
+        """Analyze one chunk with Claude, using the response cache when possible"""
+        cache_key = self._cache_key(text, document_type, excerpt)
+        analysis_data = await asyncio.to_thread(self.cache.get, cache_key) if self.cache else None
+        if analysis_data is not None:
+            logger.info("Using cached Claude analysis")
+            return analysis_data
+        
+        with STAGE_SECONDS.time(stage='prompt_build'):
+            prompt = self._build_prompt(text, document_type, excerpt)
+        response = await self._create_message(prompt)
+        
+        response_text = response.content[0].text if response.content else ""
+        
         try:
-            response = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: self.client.messages.create(
-                    model='claude-3-5-sonnet-20241022',
-                    max_tokens=4000,
-                    temperature=0.1,
-                    messages=[{
-                        'role': 'user',
-                        'content': analysis_prompt
-                    }]
+            # Parse JSON response
+            with STAGE_SECONDS.time(stage='json_parse'):
+                analysis_data = validate_analysis(json.loads(response_text))
+            # Only replies that pass validation are cached
+            if self.cache:
+                await asyncio.to_thread(
+                    self.cache.put, cache_key, CLAUDE_MODEL, PROMPT_TEMPLATE_VERSION, analysis_data
                 )
-            )
-            
-            response_text = response.content[0].text if response.content else ""
-            
-            try:
-                # Parse JSON response
-                import json
-                analysis_data = json.loads(response_text)
-            except json.JSONDecodeError:
-                logger.error(f"Failed to parse Claude response as JSON: {response_text[:500]}")
-                analysis_data = self._generate_fallback_analysis(text, document_type)
-            
-            processing_time = int((time.time() - start_time) * 1000)
-            word_count = len(text.split())
-            
-            # Generate visual configuration
-            color_scheme = self.generate_color_scheme(
-                document_type, 
-                analysis_data.get('summary', {}).get('overall_risk', 'medium')
-            )
-            layout = self.generate_layout(word_count, len(analysis_data.get('highlights', [])))
-            
-            # Construct response
-            return DynamicAnalysisResponse(
-                structured_text=analysis_data.get('structured_text', text),
+        except ValueError as e:
+            # JSONDecodeError and pydantic's ValidationError are both ValueErrors
+            logger.error(f"Invalid Claude analysis ({e}): {response_text[:500]}")
+            PARSE_FAILURES.inc(model=CLAUDE_MODEL)
+            FALLBACKS.inc(reason='parse_failure')
+            analysis_data = await asyncio.to_thread(self._generate_fallback_analysis, text, document_type)
+            # Marked so delta analysis does not keep it as Claude's result
+            analysis_data['fallback'] = True
+        return analysis_data
+    
+    async def _analyze_chunks(self, text: str, document_type: str) -> dict:
+        """
+        Analyze a document that is longer than one chunk and the clause selection
+        budget from its selected clauses; otherwise chunk by chunk, concurrently,
+        merging the results
+        """
+        with STAGE_SECONDS.time(stage='clause_selection'):
+            # A pattern scan of the whole document; keep it off the event loop
+            selection = await asyncio.to_thread(self._select_clauses, text)
+        if selection is not None:
+            logger.info(f"Analyzing selected clauses: {selection.stats()}")
+            result = await self._analyze_chunk(selection.excerpt, document_type, excerpt=True)
+            return selection.map_analysis(result)
+        
+        chunks = split_into_chunks(text, MAX_CHUNK_CHARS, CHUNK_OVERLAP)
+        if len(chunks) == 1:
+            return await self._analyze_chunk(text, document_type)
+        
+        logger.info(f"Analyzing document in {len(chunks)} chunks")
+        chunk_slots = asyncio.Semaphore(CHUNK_CONCURRENCY)
+        
+        async def analyze(chunk: str) -> dict:
+            async with chunk_slots:
+                return await self._analyze_chunk(chunk, document_type)
+        
+        tasks = [asyncio.ensure_future(analyze(chunk)) for _, chunk in chunks]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # One failed or cancelled chunk fails the document; stop the rest
+            for task in tasks:
+                task.cancel()
+            raise
+        return merge_chunk_analyses(text, chunks, results)
+    
+    def _build_response(self, text: str, document_type: str, analysis_data: dict,
+                        start_time: float) -> DynamicAnalysisResponse:
+        """Validate an analysis and attach the summary timing and visual configuration"""
+        processing_time = int((time.time() - start_time) * 1000)
+        word_count = len(text.split())
+        
+        # Generate visual configuration
+        color_scheme = self.generate_color_scheme(
+            document_type, 
+            analysis_data.get('summary', {}).get('overall_risk', 'medium')
+        )
+        layout = self.generate_layout(word_count, len(analysis_data.get('highlights', [])))
+        
+        # Construct response; only the model's output is validated, and only
+        # once; the response is then assembled without validating it again
+        with STAGE_SECONDS.time(stage='response_build'):
+            return DynamicAnalysisResponse.model_construct(
+                structured_text=str(analysis_data.get('structured_text', text)),
                 document_type=document_type,
-                highlights=[DocumentHighlight(**h) for h in analysis_data.get('highlights', [])],
-                issues=[DocumentIssue(**i) for i in analysis_data.get('issues', [])],
+                highlights=HIGHLIGHTS_ADAPTER.validate_python(analysis_data.get('highlights', [])),
+                issues=ISSUES_ADAPTER.validate_python(analysis_data.get('issues', [])),
                 summary=AnalysisSummary(
                     **analysis_data.get('summary', {}),
                     processing_time=processing_time
                 ),
-                visual_config=VisualConfig(
+                visual_config=VisualConfig.model_construct(
                     color_scheme=color_scheme,
                     layout=layout
                 )
             )
+    
+    async def _analyze_delta(self, document_id: str, text: str, document_type: str) -> Tuple[dict, dict]:
+        """
+        Analyze only the paragraphs that changed since the document's last version.
+        Each run of changed paragraphs is sent to Claude as one region and its
+        results are split back per paragraph for the next version to reuse.
+        """
+        key = content_key(document_id, CLAUDE_MODEL, PROMPT_TEMPLATE_VERSION, document_type)
+        plan = self.versions.plan(key, text)
+        runs = plan.pending_runs()
+        logger.info(f"Delta analysis of {document_id}: {plan.stats()}")
+        
+        regions = [''.join(paragraph for _, paragraph in plan.paragraphs[first:last]) for first, last in runs]
+        tasks = [asyncio.ensure_future(self._analyze_chunks(region, document_type)) for region in regions]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        
+        stored = list(plan.results)
+        for (first, last), result in zip(runs, results):
+            lengths = [len(paragraph) for _, paragraph in plan.paragraphs[first:last]]
+            plan.results[first:last] = split_region_analysis(result, lengths)
+            # Fallback results answer this request only; the next version asks Claude again
+            if not result.get('fallback'):
+                stored[first:last] = plan.results[first:last]
+        self.versions.commit(key, DeltaPlan(plan.paragraphs, stored))
+        
+        return merge_chunk_analyses(text, plan.paragraphs, plan.results), plan.stats()
+    
+    async def analyze_document(self, text: str, document_type: str, filename: str = "",
+                               document_id: Optional[str] = None) -> DynamicAnalysisResponse:
+        """Main analysis method using Claude"""
+        start_time = time.time()
+        
+        if not self.breaker.allows_calls() and not (document_id or await self.is_cached(text, document_type)):
+            # Don't queue behind a failing upstream; cached documents are still served in full
+            return await self._fallback_response(text, document_type, start_time, 'circuit_open')
+        
+        try:
+            if document_id:
+                analysis_data, delta_stats = await self._analyze_delta(document_id, text, document_type)
+                response = self._build_response(text, document_type, analysis_data, start_time)
+                response.delta = delta_stats
+                return response
+            key = content_key(text, CLAUDE_MODEL, PROMPT_TEMPLATE_VERSION, document_type)
+            analysis_data = await self._in_flight.do(key, lambda: self._analyze_chunks(text, document_type))
+            return self._build_response(text, document_type, analysis_data, start_time)
             
+        except AnalyzerOverloadedError:
+            # Backpressure goes back to the caller rather than to the fallback
+            raise
+        except CircuitOpenError:
+            return await self._fallback_response(text, document_type, start_time, 'circuit_open')
         except Exception as e:
             logger.error(f"Error analyzing document with Claude: {e}")
+            return await self._fallback_response(text, document_type, start_time, 'llm_error')
+    
+    async def _fallback_response(self, text: str, document_type: str, start_time: float,
+                                 reason: str) -> DynamicAnalysisResponse:
+        """Answer from the pattern fallback, flagged as degraded"""
+        FALLBACKS.inc(reason=reason)
+        # During an outage every request lands here; keep the scan off the event loop
+        fallback_data = await asyncio.to_thread(self._generate_fallback_analysis, text, document_type)
+        response = self._build_response(text, document_type, fallback_data, start_time)
+        response.degraded = True
+        return response
+    
+    async def _stream_chunk(self, text: str, document_type: str, emit) -> dict:
+        """
+        Stream one chunk's analysis from Claude, awaiting emit(kind, item) for
+        each highlight or issue as soon as it is complete. Returns the full analysis.
+        """
+        cache_key = self._cache_key(text, document_type)
+        analysis_data = await asyncio.to_thread(self.cache.get, cache_key) if self.cache else None
+        if analysis_data is not None:
+            for h in analysis_data.get('highlights', []):
+                await emit('highlight', h)
+            for issue in analysis_data.get('issues', []):
+                await emit('issue', issue)
+            return analysis_data
+        
+        parser = IncrementalArrayParser(('highlights', 'issues'))
+        streamed = {'highlights': [], 'issues': []}
+        with STAGE_SECONDS.time(stage='prompt_build'):
+            prompt = self._build_prompt(text, document_type)
+        if not self.breaker.allows_calls():
+            raise CircuitOpenError(f"Circuit '{self.breaker.name}' is open")
+        # A stream's duration follows its output length, so only its errors count
+        async with self._upstream_slot(), self.breaker.guard(track_latency=False):
+            try:
+                with STAGE_SECONDS.time(stage='llm_stream'):
+                    async with self.client.messages.stream(
+                        model=CLAUDE_MODEL,
+                        max_tokens=4000,
+                        temperature=0.1,
+                        messages=[{
+                            'role': 'user',
+                            'content': prompt
+                        }]
+                    ) as stream:
+                        async for delta in stream.text_stream:
+                            for key, item in parser.feed(delta):
+                                streamed[key].append(item)
+                                await emit('highlight' if key == 'highlights' else 'issue', item)
+                        final_message = await stream.get_final_message()
+            except Exception:
+                LLM_REQUESTS.inc(model=CLAUDE_MODEL, outcome='error')
+                raise
+            LLM_REQUESTS.inc(model=CLAUDE_MODEL, outcome='ok')
+            record_llm_usage(CLAUDE_MODEL, getattr(final_message, 'usage', None))
+        
+        try:
+            with STAGE_SECONDS.time(stage='json_parse'):
+                analysis_data = validate_analysis(parser.document())
+            if self.cache:
+                await asyncio.to_thread(
+                    self.cache.put, cache_key, CLAUDE_MODEL, PROMPT_TEMPLATE_VERSION, analysis_data
+                )
+            return analysis_data
+        except ValueError as e:
+            logger.error(f"Invalid streamed Claude analysis ({e}): {parser.text()[:500]}")
+            PARSE_FAILURES.inc(model=CLAUDE_MODEL)
+        
+        # Keep whatever was already sent; otherwise fall back to the pattern scan
+        FALLBACKS.inc(reason='parse_failure')
+        fallback = await asyncio.to_thread(self._generate_fallback_analysis, text, document_type)
+        if streamed['highlights'] or streamed['issues']:
+            return {**fallback, **streamed}
+        for h in fallback['highlights']:
+            await emit('highlight', h)
+        for issue in fallback['issues']:
+            await emit('issue', issue)
+        return fallback
+    
+    async def stream_document(self, text: str, document_type: str) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        Yield ('highlight', ...) and ('issue', ...) events as the model produces
+        them, then one ('summary', ...) event with the rest of the response.
+        """
+        start_time = time.time()
+        chunks = split_into_chunks(text, MAX_CHUNK_CHARS, CHUNK_OVERLAP)
+        results: List[Optional[dict]] = [None] * len(chunks)
+        events: asyncio.Queue = asyncio.Queue()
+        chunk_slots = asyncio.Semaphore(CHUNK_CONCURRENCY)
+        degraded = False
+        
+        async def run(index: int, offset: int, chunk: str) -> None:
+            nonlocal degraded
+            # What this chunk has sent so far, in chunk offsets, in case its stream fails part way
+            streamed = {'highlights': [], 'issues': []}
             
-            # Fallback analysis
-            fallback_data = self._generate_fallback_analysis(text, document_type)
-            processing_time = int((time.time() - start_time) * 1000)
+            async def emit(kind: str, item: dict) -> None:
+                streamed['highlights' if kind == 'highlight' else 'issues'].append(item)
+                if kind == 'highlight':
+                    item = shift_highlight(item, offset, len(chunk))
+                else:
+                    item = shift_issue(item, offset, len(chunk), len(text))
+                await events.put((kind, item))
             
-            return DynamicAnalysisResponse(
-                structured_text=text,
-                document_type=document_type,
-                highlights=[],
-                issues=[],
-                summary=AnalysisSummary(
-                    overall_risk='medium',
-                    key_points=[],
-                    recommendations=[],
-                    word_count=len(text.split()),
-                    processing_time=processing_time
-                ),
-                visual_config=VisualConfig(
-                    color_scheme=self.generate_color_scheme(document_type, 'medium'),
-                    layout=self.generate_layout(len(text.split()), 0)
-                )
-            )
+            try:
+                async with chunk_slots:
+                    try:
+                        results[index] = await self._stream_chunk(chunk, document_type, emit)
+                    except AnalyzerOverloadedError:
+                        raise
+                    except Exception as e:
+                        if isinstance(e, CircuitOpenError):
+                            FALLBACKS.inc(reason='circuit_open')
+                        else:
+                            logger.error(f"Error streaming analysis from Claude: {e}")
+                            FALLBACKS.inc(reason='llm_error')
+                        degraded = True
+                        fallback = await asyncio.to_thread(
+                            self._generate_fallback_analysis, chunk, document_type
+                        )
+                        # Keep what was already sent of each kind; send the fallback's for the rest
+                        sent = {key: list(items) for key, items in streamed.items() if items}
+                        for h in fallback['highlights'] if 'highlights' not in sent else []:
+                            await emit('highlight', h)
+                        for issue in fallback['issues'] if 'issues' not in sent else []:
+                            await emit('issue', issue)
+                        results[index] = {**fallback, **sent}
+            except AnalyzerOverloadedError as e:
+                await events.put(('failed', e))
+            finally:
+                await events.put(('done', None))
+        
+        tasks = [asyncio.ensure_future(run(i, offset, chunk)) for i, (offset, chunk) in enumerate(chunks)]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                kind, item = await events.get()
+                if kind == 'done':
+                    remaining -= 1
+                    continue
+                if kind == 'failed':
+                    raise item
+                
+                try:
+                    model = DocumentHighlight(**item) if kind == 'highlight' else DocumentIssue(**item)
+                except Exception as e:
+                    logger.warning(f"Skipping invalid streamed {kind}: {e}")
+                    continue
+                yield kind, model.model_dump()
+        finally:
+            # The client went away or a chunk failed; stop the remaining upstream calls
+            for task in tasks:
+                task.cancel()
+        
+        analysis_data = results[0] if len(chunks) == 1 else merge_chunk_analyses(text, chunks, results)
+        summary = analysis_data.get('summary', {})
+        analysis_data = {
+            **analysis_data,
+            'summary': {
+                'overall_risk': 'medium',
+                'key_points': [],
+                'recommendations': [],
+                'word_count': len(text.split()),
+                **summary
+            },
+            # Already streamed; only the summary, layout and text remain
+            'highlights': [],
+            'issues': []
+        }
+        response = self._build_response(text, document_type, analysis_data, start_time)
+        response.visual_config.layout = self.generate_layout(
+            response.summary.word_count,
+            sum(len(r.get('highlights', [])) for r in results if r)
+        )
+        response.degraded = degraded
+        yield 'summary', response.model_dump(exclude={'highlights', 'issues'})
     
     def _generate_fallback_analysis(self, text: str, document_type: str) -> dict:
-        """Pattern-based fallback analysis"""
-        risk_patterns = [
-            {'pattern': r'automatic renewal|auto-renew', 'type': 'risky', 'reason': 'Automatic renewal clause'},
-            {'pattern': r'non-refundable|no refund', 'type': 'risky', 'reason': 'Non-refundable terms'},
-            {'pattern': r'indemnif|hold harmless', 'type': 'attention', 'reason': 'Indemnification clause'},
-            {'pattern': r'force majeure', 'type': 'neutral', 'reason': 'Force majeure provision'},
-            {'pattern': r'cancellation|terminate', 'type': 'attention', 'reason': 'Termination terms'}
-        ]
+        """Pattern-based fallback analysis driven by the audit constitution"""
+        with STAGE_SECONDS.time(stage='constitution_eval'):
+            audit = get_engine().evaluate(text)
         
         highlights = []
-        for pattern_info in risk_patterns:
-            matches = list(re.finditer(pattern_info['pattern'], text, re.IGNORECASE))
-            for match in matches:
+        for violation in audit['violations']:
+            for start, end in violation['spans']:
                 highlights.append({
-                    'start': match.start(),
-                    'end': match.end(),
-                    'type': pattern_info['type'],
-                    'confidence': 0.7,
-                    'reason': pattern_info['reason'],
-                    'category': 'Pattern Match'
+                    'start': start,
+                    'end': end,
+                    'type': CONSTITUTION_HIGHLIGHT_TYPES.get(violation['severity'], 'attention'),
+                    'confidence': violation['confidence'],
+                    'reason': violation['description'],
+                    'category': violation['name']
                 })
+        highlights.sort(key=lambda h: h['start'])
         
         issues = []
         if any(h['type'] == 'risky' for h in highlights):
@@ -331,6 +856,18 @@ Document text: {text[:15000]}
                 'icon': 'alert-triangle',
                 'color': '#f59e0b'
             })
+        for clause in audit['missing_clauses']:
+            issues.append({
+                'severity': 'info' if clause['needs_review'] else 'warning',
+                'title': f"Missing: {clause['name']}",
+                'description': clause['description'],
+                'location': 100.0,
+                'visual_priority': 5,
+                'action_required': True,
+                'compliance_issue': True,
+                'icon': 'file-question',
+                'color': '#6b7280'
+            })
         
         return {
             'structured_text': text,
@@ -344,11 +881,69 @@ Document text: {text[:15000]}
             }
         }
 
+    async def warm_cache(self, directory: str) -> Dict[str, int]:
+        """Analyze every .txt, .pdf and .docx file in a directory that is not cached yet"""
+        counts = {'analyzed': 0, 'cached': 0, 'failed': 0}
+        if not self.cache:
+            logger.warning("LLM response cache is disabled; nothing to warm")
+            return counts
+
+        for path in sorted(Path(directory).rglob('*')):
+            suffix = path.suffix.lower()
+            if suffix not in ('.txt', '.pdf', '.docx'):
+                continue
+            try:
+                if suffix == '.pdf':
+                    text = extract_pdf_text(path.read_bytes())
+                elif suffix == '.docx':
+                    text = extract_docx_text(path.read_bytes())
+                else:
+                    text = path.read_text(encoding='utf-8', errors='replace')
+
+                document_type = self.detect_document_type(text, path.name)
+                if await self.is_cached(text, document_type):
+                    counts['cached'] += 1
+                    continue
+
+                await self.analyze_document(text, document_type, path.name)
+                # analyze_document falls back instead of raising, so check it was stored
+                counts['analyzed' if await self.is_cached(text, document_type) else 'failed'] += 1
+            except Exception as e:
+                logger.error(f"Failed to warm cache from {path}: {e}")
+                counts['failed'] += 1
+
+        logger.info(f"Cache warm-up finished: {counts}")
+        return counts
+
 # Initialize analyzer
-analyzer = DynamicDocumentAnalyzer()
+analyzer = DynamicDocumentAnalyzer(cache=response_cache)
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up(
+        detect_type,
+        lambda text: analyzer._generate_fallback_analysis(text, 'legal_agreement'),
+        lambda text: select_clauses(text, token_budget=1)
+    )
+    job_queue.start()
+    yield
+    await job_queue.stop()
+    shutdown_extraction_pool()
 
 # FastAPI app
-app = FastAPI(title="Dynamic Document Analyzer API", version="2.0.0")
+app = FastAPI(
+    title="Dynamic Document Analyzer API",
+    version="2.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
+)
+
+# Refuse oversized bodies while they stream in rather than after buffering them
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits=UPLOAD_BODY_LIMITS,
+    default_limit=ANALYZE_MAX_BODY_BYTES
+)
 
 # CORS middleware
 app.add_middleware(
@@ -359,9 +954,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.post("/api/dynamic-analyze", response_model=DynamicAnalysisResponse)
-async def analyze_document_endpoint(request: AnalyzeRequest):
-    """Enhanced document analysis endpoint"""
+async def run_until_disconnected(http_request: Request, coro):
+    """Await coro, cancelling it (and any upstream call) if the client disconnects first"""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info("Client disconnected; cancelling analysis")
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+async def run_document_analysis(request: AnalyzeRequest, http_request: Request) -> DynamicAnalysisResponse:
+    """Analyze a request's text, mapping failures to HTTP errors"""
     try:
         # Detect document type if not provided
         document_type = request.document_type
@@ -371,15 +984,26 @@ async def analyze_document_endpoint(request: AnalyzeRequest):
         logger.info(f"Analyzing {document_type} document with {len(request.text.split())} words")
         
         # Perform analysis
-        result = await analyzer.analyze_document(
+        result = await run_until_disconnected(http_request, analyzer.analyze_document(
             request.text, 
             document_type, 
-            request.filename or ""
-        )
+            request.filename or "",
+            request.document_id
+        ))
         
         logger.info(f"Analysis completed in {result.summary.processing_time}ms")
         return result
         
+    except HTTPException:
+        raise
+    except AnalyzerOverloadedError as e:
+        logger.warning(f"Rejecting dynamic analysis: {e}")
+        OVERLOAD_REJECTIONS.inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Analyzer is busy. Please try again shortly.",
+            headers={"Retry-After": "1"}
+        )
     except Exception as e:
         logger.error(f"Error in dynamic analysis endpoint: {e}")
         raise HTTPException(
@@ -387,60 +1011,229 @@ async def analyze_document_endpoint(request: AnalyzeRequest):
             detail=f"Analysis failed: {str(e)}"
         )
 
+@app.post("/api/dynamic-analyze", response_model=DynamicAnalysisResponse)
+async def analyze_document_endpoint(request: AnalyzeRequest, http_request: Request):
+    """Enhanced document analysis endpoint"""
+    # The response is validated as it is built, so skip response_model revalidation
+    return FastJSONResponse(await run_document_analysis(request, http_request))
+
+def format_sse(event: str, payload: dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+
+@app.post("/api/dynamic-analyze/stream")
+async def analyze_document_stream_endpoint(request: AnalyzeRequest):
+    """
+    Streaming document analysis: highlights and issues as server-sent events, then a summary.
+    Every chunk of a long document is streamed from the model; /api/dynamic-analyze instead
+    analyzes a document longer than one chunk from its selected clauses, so its results can differ.
+    """
+    document_type = request.document_type
+    if not document_type:
+        document_type = analyzer.detect_document_type(request.text, request.filename or "")
+    
+    logger.info(f"Streaming analysis of {document_type} document with {len(request.text.split())} words")
+    
+    async def events():
+        try:
+            async for event, payload in analyzer.stream_document(request.text, document_type):
+                yield format_sse(event, payload)
+        except AnalyzerOverloadedError as e:
+            logger.warning(f"Rejecting streaming analysis: {e}")
+            OVERLOAD_REJECTIONS.inc()
+            yield format_sse('error', {'detail': "Analyzer is busy. Please try again shortly."})
+        except Exception as e:
+            logger.error(f"Error in streaming analysis endpoint: {e}")
+            yield format_sse('error', {'detail': "Analysis failed"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+DOCX_CONTENT_TYPES = ['application/vnd.openxmlformats-officedocument.wordprocessingml.document']
+
+async def spool_upload(file: UploadFile, directory: Optional[str] = None) -> str:
+    """
+    Check an upload's type and copy it to a named file the extraction workers
+    can open; the form parser has already spooled it, so it is never read into memory
+    """
+    if file.content_type != 'application/pdf' and file.content_type not in DOCX_CONTENT_TYPES:
+        raise HTTPException(status_code=400, detail="Unsupported file type")
+    suffix = '.pdf' if file.content_type == 'application/pdf' else '.docx'
+    return await asyncio.to_thread(spool_to_disk, file.file, suffix, directory)
+
+async def extract_upload(path: str, content_type: str) -> Tuple[str, Optional[List[Dict[str, int]]]]:
+    """Extract a spooled upload's text, with a page map for PDFs"""
+    try:
+        if content_type == 'application/pdf':
+            return await extract_pdf(path)
+        return await extract_docx(path), None
+    except Exception as e:
+        kind = 'PDF' if content_type == 'application/pdf' else 'DOCX'
+        raise HTTPException(status_code=400, detail=f"Failed to extract {kind} text: {str(e)}")
+
+def attach_pages(result: DynamicAnalysisResponse, page_map: Optional[List[Dict[str, int]]]) -> None:
+    if page_map:
+        for highlight in result.highlights:
+            highlight.page = page_for_offset(page_map, highlight.start)
+        result.pages = page_map
+
 @app.post("/api/analyze-file")
-async def analyze_file_endpoint(file: UploadFile = File(...)):
+async def analyze_file_endpoint(http_request: Request, file: UploadFile = File(...)):
     """File upload and analysis endpoint"""
+    path = await spool_upload(file)
     try:
-        # Read file content
-        content = await file.read()
-        
-        # Extract text based on file type
-        if file.content_type == 'application/pdf':
-            text = extract_pdf_text(content)
-        elif file.content_type in ['application/vnd.openxmlformats-officedocument.wordprocessingml.document']:
-            text = extract_docx_text(content)
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file type")
-        
+        text, page_map = await extract_upload(path, file.content_type)
+
         # Analyze document
         request = AnalyzeRequest(text=text, filename=file.filename)
-        return await analyze_document_endpoint(request)
-        
+        result = await run_document_analysis(request, http_request)
+        attach_pages(result, page_map)
+        return FastJSONResponse(result)
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in file analysis endpoint: {e}")
         raise HTTPException(
             status_code=500,
             detail=f"File analysis failed: {str(e)}"
         )
+    finally:
+        with contextlib.suppress(OSError):
+            os.remove(path)
+
+async def analyze_job_request(request: AnalyzeRequest) -> DynamicAnalysisResponse:
+    document_type = request.document_type or analyzer.detect_document_type(request.text, request.filename or "")
+    return await analyzer.analyze_document(request.text, document_type, request.filename or "", request.document_id)
+
+async def run_analysis_job(payload: dict) -> dict:
+    """Job handler for /api/jobs/dynamic-analyze"""
+    result = await analyze_job_request(AnalyzeRequest(**payload))
+    return result.model_dump()
+
+async def run_file_job(payload: dict) -> dict:
+    """Job handler for /api/jobs/analyze-file; the upload is kept until the job no longer needs it"""
+    path = payload['path']
+    try:
+        text, page_map = await extract_upload(path, payload['content_type'])
+        result = await analyze_job_request(AnalyzeRequest(text=text, filename=payload['filename']))
+        attach_pages(result, page_map)
+    except AnalyzerOverloadedError:
+        # The job is deferred and runs again, so the upload stays
+        raise
+    except Exception:
+        remove_job_upload(payload)
+        raise
+    # Cancelled jobs keep their upload; they run again after a restart
+    remove_job_upload(payload)
+    return result.model_dump()
+
+def remove_job_upload(job_or_payload: dict) -> None:
+    path = job_or_payload.get('payload', job_or_payload).get('path')
+    if path:
+        with contextlib.suppress(OSError):
+            os.remove(path)
+
+job_queue = JobQueue(
+    JobStore(JOBS_DB_PATH, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS),
+    handlers={'dynamic_analyze': run_analysis_job, 'analyze_file': run_file_job},
+    workers=JOB_WORKERS,
+    max_queued=JOB_MAX_QUEUED,
+    result_ttl=JOB_RESULT_TTL,
+    on_prune=remove_job_upload,
+    # Jobs absorb load spikes: waiting too long for an upstream slot defers the job
+    retry_on=(AnalyzerOverloadedError,)
+)
+
+async def submit_job(kind: str, payload: dict, priority: str) -> FastJSONResponse:
+    try:
+        job_id = await job_queue.submit(kind, payload, priority)
+    except JobQueueFullError as e:
+        logger.warning(f"Rejecting {kind} job: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Too many queued jobs. Please try again later.",
+            headers={"Retry-After": "30"}
+        )
+    logger.info(f"Queued {priority} {kind} job {job_id}")
+    return FastJSONResponse(
+        {'job_id': job_id, 'status': 'queued', 'status_url': f"/api/jobs/{job_id}"},
+        status_code=202,
+        headers={"Location": f"/api/jobs/{job_id}"}
+    )
+
+@app.post("/api/jobs/dynamic-analyze", status_code=202)
+async def submit_analysis_job(request: AnalyzeRequest,
+                              priority: Literal['interactive', 'bulk'] = 'interactive'):
+    """Queue a document analysis and return its job ID straight away"""
+    return await submit_job('dynamic_analyze', request.model_dump(), priority)
+
+@app.post("/api/jobs/analyze-file", status_code=202)
+async def submit_file_job(file: UploadFile = File(...),
+                          priority: Literal['interactive', 'bulk'] = 'bulk'):
+    """Queue a file analysis; the upload is stored with the job until it has run"""
+    Path(JOB_UPLOAD_DIR).mkdir(parents=True, exist_ok=True)
+    path = await spool_upload(file, JOB_UPLOAD_DIR)
+    payload = {'path': path, 'content_type': file.content_type, 'filename': file.filename}
+    try:
+        return await submit_job('analyze_file', payload, priority)
+    except HTTPException:
+        remove_job_upload(payload)
+        raise
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """
+    A job's status, with its result once it has succeeded. Pass wait (seconds)
+    to long-poll until the job finishes or the wait runs out.
+    """
+    job = await job_queue.wait(job_id, min(max(wait, 0), JOB_MAX_WAIT))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    body = {
+        'job_id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'deferrals': job['deferrals'],
+        'created_at': datetime.utcfromtimestamp(job['created_at']).isoformat(),
+        'started_at': datetime.utcfromtimestamp(job['started_at']).isoformat() if job['started_at'] else None,
+        'finished_at': datetime.utcfromtimestamp(job['finished_at']).isoformat() if job['finished_at'] else None
+    }
+    if job['status'] == SUCCEEDED:
+        body['result'] = job['result']
+    elif job['status'] == FAILED:
+        body['error'] = job['error']
+    return FastJSONResponse(body)
 
 def extract_pdf_text(content: bytes) -> str:
     """Extract text from PDF content"""
+    import PyPDF2
+
     try:
-        pdf_file = BytesIO(content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        
-        return text
+        pdf_reader = PyPDF2.PdfReader(BytesIO(content))
+        return ''.join(page.extract_text() + "\n" for page in pdf_reader.pages)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to extract PDF text: {str(e)}")
 
 def extract_docx_text(content: bytes) -> str:
     """Extract text from DOCX content"""
+    import docx
+
     try:
-        docx_file = BytesIO(content)
-        doc = docx.Document(docx_file)
-        text = ""
-        
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        
-        return text
+        doc = docx.Document(BytesIO(content))
+        return ''.join(paragraph.text + "\n" for paragraph in doc.paragraphs)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to extract DOCX text: {str(e)}")
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics for this worker process"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint"""
@@ -448,9 +1241,14 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
         "version": "2.0.0",
-        "analyzer": "claude-3.5-sonnet"
+        "analyzer": "claude-3.5-sonnet",
+        "llm_circuit": analyzer.breaker.snapshot()
     }
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    if len(sys.argv) == 3 and sys.argv[1] == "warm-cache":
+        # python dynamic_analyzer.py warm-cache <directory>
+        asyncio.run(analyzer.warm_cache(sys.argv[2]))
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,99 @@
+"""
+Document text extraction
+PDF pages are extracted in parallel worker processes and joined once, with a page-to-offset map
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+# Pages handed to one worker task
+PAGES_PER_TASK = int(os.getenv("PAGES_PER_TASK", "16"))
+
+_extraction_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    """Create the extraction worker pool on first use"""
+    global _extraction_pool
+    if _extraction_pool is None:
+        _extraction_pool = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS)
+    return _extraction_pool
+
+
+def shutdown_extraction_pool() -> None:
+    global _extraction_pool
+    if _extraction_pool is not None:
+        _extraction_pool.shutdown(wait=False, cancel_futures=True)
+        _extraction_pool = None
+
+
+def count_pdf_pages(path: str) -> int:
+    import PyPDF2
+    return len(PyPDF2.PdfReader(path).pages)
+
+
+def extract_pdf_pages(path: str, start: int, end: int) -> List[str]:
+    """Extract pages [start, end) of a PDF; runs in a worker process"""
+    import PyPDF2
+    reader = PyPDF2.PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def extract_docx_paragraphs(path: str) -> List[str]:
+    """Extract paragraph texts of a DOCX file; runs in a worker process"""
+    import docx
+    return [paragraph.text for paragraph in docx.Document(path).paragraphs]
+
+
+def join_pages(pages: List[str]) -> Tuple[str, List[Dict[str, int]]]:
+    """Join page texts with newlines and record where each page starts and ends"""
+    page_map = []
+    offset = 0
+    for number, page in enumerate(pages, start=1):
+        page_map.append({'page': number, 'start': offset, 'end': offset + len(page)})
+        offset += len(page) + 1
+    return ''.join(page + "\n" for page in pages), page_map
+
+
+def page_for_offset(page_map: List[Dict[str, int]], offset: int) -> Optional[int]:
+    """Page number containing a character offset"""
+    if not page_map:
+        return None
+    starts = [entry['start'] for entry in page_map]
+    index = bisect_right(starts, offset) - 1
+    return page_map[max(index, 0)]['page']
+
+
+def spool_to_disk(source: BinaryIO, suffix: str = "", directory: Optional[str] = None) -> str:
+    """Copy an upload to a named temporary file in bounded memory; the caller removes it"""
+    source.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=suffix, dir=directory, delete=False) as target:
+        shutil.copyfileobj(source, target, length=1024 * 1024)
+        return target.name
+
+
+async def extract_pdf(path: str) -> Tuple[str, List[Dict[str, int]]]:
+    """Extract a PDF's text with its pages spread across the worker pool"""
+    loop = asyncio.get_running_loop()
+    pool = get_extraction_pool()
+    page_count = await loop.run_in_executor(pool, count_pdf_pages, path)
+
+    ranges = [(start, min(start + PAGES_PER_TASK, page_count))
+              for start in range(0, page_count, PAGES_PER_TASK)]
+    results = await asyncio.gather(*[
+        loop.run_in_executor(pool, extract_pdf_pages, path, start, end) for start, end in ranges
+    ])
+    return join_pages([page for pages in results for page in pages])
+
+
+async def extract_docx(path: str) -> str:
+    """Extract a DOCX file's text off the event loop"""
+    loop = asyncio.get_running_loop()
+    paragraphs = await loop.run_in_executor(get_extraction_pool(), extract_docx_paragraphs, path)
+    return ''.join(paragraph + "\n" for paragraph in paragraphs)
@@ -0,0 +1,25 @@
+"""
+Fast JSON responses
+Serializes already-validated results without FastAPI's response_model revalidation and jsonable_encoder pass
+"""
+
+from typing import Any
+
+import orjson
+from pydantic import BaseModel
+from starlette.responses import Response
+
+
+class FastJSONResponse(Response):
+    """
+    Return this from an endpoint to skip response_model processing. Pydantic
+    models are dumped by pydantic-core's serializer without being validated
+    again; plain dicts and lists go through orjson.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.__pydantic_serializer__.to_json(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,338 @@
+"""
+Background analysis jobs
+SQLite-backed (WAL mode) priority queue, so queued and interrupted jobs survive a worker restart
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+# Lower runs first; interactive requests overtake queued bulk uploads
+PRIORITIES = {
+    'interactive': 0,
+    'bulk': 10
+}
+
+# Seconds between sweeps for expired job results
+PRUNE_INTERVAL = 600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    deferrals INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL DEFAULT 0,
+    lease_expires REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority, created_at);
+"""
+
+# Added after the first release; databases created before then gain them on open
+_ADDED_COLUMNS = {
+    'deferrals': "INTEGER NOT NULL DEFAULT 0",
+    'available_at': "REAL NOT NULL DEFAULT 0"
+}
+
+_COLUMNS = ('id', 'kind', 'priority', 'status', 'payload', 'result', 'error', 'attempts', 'deferrals',
+            'created_at', 'started_at', 'finished_at')
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class JobQueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class JobStore:
+    """
+    Jobs and their results. A worker claims a job by leasing it; a job whose
+    lease runs out (its worker died) is claimed again, up to max_attempts times.
+    Several worker processes can share one database file.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 60.0, max_attempts: int = 3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, definition in _ADDED_COLUMNS.items():
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+
+    def create(self, kind: str, payload: Dict[str, Any], priority: int) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, priority, status, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, priority, QUEUED, json.dumps(payload, separators=(',', ':')), time.time())
+            )
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Lease the most urgent runnable job, including ones abandoned by dead workers"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_expires = NULL "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, f"Abandoned after {self.max_attempts} attempts", now, RUNNING, now, self.max_attempts)
+            )
+            row = self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_expires = ?, started_at = ? "
+                "WHERE id = (SELECT id FROM jobs WHERE (status = ? AND available_at <= ?) "
+                "OR (status = ? AND lease_expires < ?) "
+                "ORDER BY priority, created_at LIMIT 1) "
+                f"RETURNING {', '.join(_COLUMNS)}",
+                (RUNNING, now + self.lease_seconds, now, QUEUED, now, RUNNING, now)
+            ).fetchone()
+        return self._to_job(row) if row else None
+
+    def renew(self, job_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND status = ?",
+                (time.time() + self.lease_seconds, job_id, RUNNING)
+            )
+
+    def release(self, job_id: str) -> None:
+        """Put an interrupted job back in the queue without counting the attempt"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts - 1, lease_expires = NULL "
+                "WHERE id = ? AND status = ?",
+                (QUEUED, job_id, RUNNING)
+            )
+
+    def defer(self, job_id: str, delay: float) -> None:
+        """Put a job back in the queue to run again after delay seconds, without counting the attempt"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts - 1, deferrals = deferrals + 1, "
+                "available_at = ?, lease_expires = NULL WHERE id = ? AND status = ?",
+                (QUEUED, time.time() + delay, job_id, RUNNING)
+            )
+
+    def finish(self, job_id: str, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, lease_expires = NULL, finished_at = ? WHERE id = ?",
+                (SUCCEEDED, json.dumps(result, separators=(',', ':')), time.time(), job_id)
+            )
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_expires = NULL, finished_at = ? WHERE id = ?",
+                (FAILED, error, time.time(), job_id)
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._to_job(row) if row else None
+
+    def count_queued(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+
+    def prune(self, max_age: float) -> List[Dict[str, Any]]:
+        """Delete jobs that finished more than max_age seconds ago, returning them"""
+        cutoff = time.time() - max_age
+        with self._lock:
+            rows = self._conn.execute(
+                f"DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ? RETURNING {', '.join(_COLUMNS)}",
+                (SUCCEEDED, FAILED, cutoff)
+            ).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {QUEUED: 0, RUNNING: 0, SUCCEEDED: 0, FAILED: 0, **dict(rows)}
+
+    @staticmethod
+    def _to_job(row: tuple) -> Dict[str, Any]:
+        job = dict(zip(_COLUMNS, row))
+        job['payload'] = json.loads(job['payload'])
+        if job['result'] is not None:
+            job['result'] = json.loads(job['result'])
+        return job
+
+
+class JobQueue:
+    """
+    A fixed number of asyncio workers that run stored jobs by priority.
+    Jobs submitted by other processes sharing the store are picked up by
+    polling; jobs submitted here wake an idle worker immediately. Store calls
+    run in threads, since SQLite may wait on another process's lock.
+    """
+
+    def __init__(self, store: JobStore, handlers: Dict[str, JobHandler], workers: int = 4,
+                 max_queued: int = 1000, poll_interval: float = 1.0, result_ttl: float = 86400.0,
+                 on_prune: Callable[[Dict[str, Any]], None] = lambda job: None,
+                 retry_on: Tuple[Type[BaseException], ...] = (), retry_delay: float = 1.0,
+                 max_retry_delay: float = 60.0):
+        self.store = store
+        self.handlers = handlers
+        self.workers = workers
+        self.max_queued = max_queued
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self.on_prune = on_prune
+        # Errors meaning "not now" (e.g. overload): the job is queued again with
+        # exponential backoff instead of failing
+        self.retry_on = retry_on
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        # Replaced after every finished job so each long-poll wakes exactly once per change
+        self._finished: Optional[asyncio.Event] = None
+        self._last_prune = float('-inf')
+
+    def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._finished = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+        logger.info(f"Started {self.workers} job worker(s); queue: {self.store.stats()}")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, kind: str, payload: Dict[str, Any], priority: str = 'interactive') -> str:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if await asyncio.to_thread(self.store.count_queued) >= self.max_queued:
+            raise JobQueueFullError(f"{self.max_queued} jobs are already queued")
+        job_id = await asyncio.to_thread(self.store.create, kind, payload, PRIORITIES[priority])
+        if self._wakeup:
+            self._wakeup.set()
+        return job_id
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """The job once it has finished, or as it stands when timeout runs out"""
+        deadline = time.monotonic() + timeout
+        while True:
+            finished = self._finished
+            job = await asyncio.to_thread(self.store.get, job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job['status'] in (SUCCEEDED, FAILED) or remaining <= 0 or finished is None:
+                return job
+            # Woken by local workers; polled for jobs run by other processes
+            try:
+                await asyncio.wait_for(finished.wait(), min(self.poll_interval, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self) -> None:
+        while True:
+            try:
+                job = await asyncio.to_thread(self.store.claim)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to claim a job: {e}")
+                job = None
+            if job is None:
+                await self._prune_if_due()
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        job_id = job['id']
+        renewer = asyncio.ensure_future(self._renew_lease(job_id))
+        try:
+            result = await self.handlers[job['kind']](job['payload'])
+        except asyncio.CancelledError:
+            # Shutting down; another worker or the next start picks it up again
+            await self._update(self.store.release, job_id)
+            raise
+        except self.retry_on as e:
+            delay = min(self.retry_delay * 2 ** job['deferrals'], self.max_retry_delay)
+            logger.warning(f"Job {job_id} ({job['kind']}) deferred for {delay:.0f}s: {e}")
+            await self._update(self.store.defer, job_id, delay)
+            return
+        except Exception as e:
+            logger.error(f"Job {job_id} ({job['kind']}) failed: {e}")
+            await self._update(self.store.fail, job_id, str(getattr(e, 'detail', None) or e))
+        else:
+            if await self._update(self.store.finish, job_id, result):
+                logger.info(f"Job {job_id} ({job['kind']}) finished")
+        finally:
+            renewer.cancel()
+        finished, self._finished = self._finished, asyncio.Event()
+        finished.set()
+
+    async def _update(self, method: Callable[..., None], *args) -> bool:
+        """
+        Record a job's outcome. If the database stays locked, the job's lease
+        runs out and it is claimed and run again rather than lost.
+        """
+        try:
+            await asyncio.to_thread(method, *args)
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Failed to {method.__name__} job {args[0]}: {e}")
+            return False
+
+    async def _renew_lease(self, job_id: str) -> None:
+        interval = self.store.lease_seconds / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.store.renew, job_id)
+                interval = self.store.lease_seconds / 3
+            except sqlite3.Error as e:
+                # Keep trying, sooner, while the lease is still ours
+                logger.error(f"Failed to renew the lease of job {job_id}: {e}")
+                interval = min(1.0, self.store.lease_seconds / 10)
+
+    async def _prune_if_due(self) -> None:
+        now = time.monotonic()
+        if now - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        try:
+            pruned = await asyncio.to_thread(self.store.prune, self.result_ttl)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to prune jobs: {e}")
+            return
+        for job in pruned:
+            self.on_prune(job)
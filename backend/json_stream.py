@@ -0,0 +1,97 @@
+"""
+Incremental JSON parsing
+Pulls complete elements out of top-level arrays while a JSON document is still streaming in
+"""
+
+import json
+from typing import Any, Iterable, List, Optional, Tuple
+
+
+class IncrementalArrayParser:
+    """
+    Feed text as it arrives; every complete object inside one of the watched
+    top-level arrays (e.g. "highlights") is returned as soon as its closing
+    brace is seen. Text before the first '{' (prose, code fences) is ignored.
+    """
+
+    def __init__(self, array_keys: Iterable[str]):
+        self.array_keys = set(array_keys)
+        self._chunks: List[str] = []
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escaped = False
+        # Characters of the top-level string or array element being read
+        self._key_chars: Optional[List[str]] = None
+        self._element_chars: Optional[List[str]] = None
+        self._last_key: Optional[str] = None
+        self._current_array: Optional[str] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume more text and return the (array key, element) pairs it completed"""
+        self._chunks.append(chunk)
+        completed = []
+
+        for ch in chunk:
+            if self._element_chars is not None:
+                self._element_chars.append(ch)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == '\\':
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._key_chars is not None:
+                        self._last_key = ''.join(self._key_chars)
+                        self._key_chars = None
+                    continue
+                if self._key_chars is not None:
+                    self._key_chars.append(ch)
+                continue
+
+            if not self._started:
+                if ch == '{':
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                # Strings directly inside the top-level object are keys or scalar values
+                if self._depth == 1:
+                    self._key_chars = []
+            elif ch in '{[':
+                if ch == '[' and self._depth == 1 and self._last_key in self.array_keys:
+                    self._current_array = self._last_key
+                elif ch == '{' and self._depth == 2 and self._current_array:
+                    self._element_chars = ['{']
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if ch == '}' and self._depth == 2 and self._element_chars is not None:
+                    raw = ''.join(self._element_chars)
+                    self._element_chars = None
+                    try:
+                        completed.append((self._current_array, json.loads(raw)))
+                    except json.JSONDecodeError:
+                        pass
+                elif self._depth == 1:
+                    self._current_array = None
+                    self._last_key = None
+
+        return completed
+
+    def text(self) -> str:
+        """Everything fed so far"""
+        return ''.join(self._chunks)
+
+    def document(self) -> Any:
+        """Parse the complete JSON object once the stream has ended"""
+        text = self.text()
+        start = text.find('{')
+        end = text.rfind('}')
+        if start == -1 or end < start:
+            raise json.JSONDecodeError("No JSON object in response", text, 0)
+        return json.loads(text[start:end + 1])
@@ -0,0 +1,156 @@
+"""
+Persistent LLM response cache
+SQLite-backed (WAL mode) so several uvicorn workers share parsed Claude results
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from result_cache import content_key
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_responses_last_access ON llm_responses (last_access);
+-- Running total of llm_responses.size, so writes need not sum the table
+CREATE TABLE IF NOT EXISTS llm_cache_size (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total INTEGER NOT NULL
+);
+"""
+
+# Least recently used rows read per eviction query
+EVICT_BATCH = 64
+
+
+class LLMResponseCache:
+    """Parsed model responses keyed on model, prompt template version and document hash"""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        # WAL lets readers in other workers proceed while one worker writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        # Caches created before the running total get it summed once
+        self._conn.execute(
+            "INSERT OR IGNORE INTO llm_cache_size (id, total) "
+            "SELECT 0, COALESCE(SUM(size), 0) FROM llm_responses"
+        )
+
+    @staticmethod
+    def make_key(model: str, prompt_version: str, text: str, *parts: str) -> str:
+        return content_key(text, model, prompt_version, *parts)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE llm_responses SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+        return json.loads(row[0])
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None
+
+    def put(self, key: str, model: str, prompt_version: str, value: Dict[str, Any]) -> None:
+        payload = json.dumps(value, separators=(',', ':'))
+        size = len(payload.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front so workers keep the total consistent
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT size FROM llm_responses WHERE key = ?", (key,)
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_responses "
+                    "(key, model, prompt_version, value, size, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, model, prompt_version, payload, size, now, now)
+                )
+                total = self._add_size(size - (row[0] if row else 0))
+                if total > self.max_bytes:
+                    self._evict(total)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _add_size(self, delta: int) -> int:
+        return self._conn.execute(
+            "UPDATE llm_cache_size SET total = total + ? WHERE id = 0 RETURNING total", (delta,)
+        ).fetchone()[0]
+
+    def _evict(self, total: int) -> None:
+        """Drop least recently used rows until the cache fits its byte budget"""
+        evicted = 0
+        freed = 0
+        while total - freed > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM llm_responses ORDER BY last_access ASC LIMIT ?", (EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total - freed <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                freed += size
+                evicted += 1
+        self._add_size(-freed)
+        logger.info(f"Evicted {evicted} cached LLM response(s)")
+
+    def clear(self) -> int:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                removed = self._conn.execute("DELETE FROM llm_responses").rowcount
+                self._conn.execute("UPDATE llm_cache_size SET total = 0 WHERE id = 0")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+            total = self._conn.execute("SELECT total FROM llm_cache_size WHERE id = 0").fetchone()[0]
+        return {
+            'path': self.path,
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes
+        }
@@ -0,0 +1,67 @@
+"""
+Combined API
+One ASGI app serving the pattern analysis routes of app.py and the Claude analysis routes of dynamic_analyzer.py
+
+    uvicorn main:app --host 0.0.0.0 --port 8000
+"""
+
+import contextlib
+
+from fastapi import APIRouter, FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.routing import APIRoute
+
+import app as pattern_api
+import dynamic_analyzer as dynamic_api
+from fast_json import FastJSONResponse
+from request_limits import BodySizeLimitMiddleware
+
+
+def api_routes(source: FastAPI, exclude: tuple = ()) -> APIRouter:
+    """The endpoints of an app, without its own OpenAPI and docs routes"""
+    router = APIRouter()
+    router.routes.extend(
+        route for route in source.routes if isinstance(route, APIRoute) and route.path not in exclude
+    )
+    return router
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with pattern_api.lifespan(app), dynamic_api.lifespan(app):
+        yield
+
+
+app = FastAPI(
+    title="REDFLAGGED API",
+    description="Contract red flag detection and Claude-powered document analysis",
+    version="2.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
+)
+
+app.include_router(api_routes(pattern_api.app))
+# Both apps render the same process-wide registry at /metrics
+app.include_router(api_routes(dynamic_api.app, exclude=("/metrics",)))
+
+# Same stack as app.py: CORS outermost, then rate limiting, then body limits.
+# The dynamic routes get app.py's CORS policy here, not dynamic_analyzer's allow-all one.
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits={**pattern_api.BODY_LIMITS, **dynamic_api.UPLOAD_BODY_LIMITS},
+    default_limit=pattern_api.ANALYZE_MAX_BODY_BYTES
+)
+
+app.middleware("http")(pattern_api.rate_limit_middleware)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=pattern_api.ALLOWED_ORIGINS,
+    allow_credentials=True,
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization", "X-API-Key"],
+)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8000)
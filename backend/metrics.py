@@ -0,0 +1,247 @@
+"""
+Process metrics
+Counters and latency histograms rendered in the Prometheus text exposition format
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from a regex scan up to a slow upstream call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0, 120.0)
+
+# Dollars per million tokens as (input, output); override with
+# LLM_PRICES='{"model": [input, output]}'
+LLM_PRICES = {
+    'claude-3-5-sonnet-20241022': (3.0, 15.0),
+    'claude-3-5-haiku-20241022': (0.8, 4.0)
+}
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """A monotonically increasing value per label combination"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.label_names:
+            values = [((), 0.0)]
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                for key, value in values]
+
+
+class Gauge:
+    """A value that can go up and down, per label combination"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels: str) -> float:
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    samples = Counter.samples
+
+
+class Histogram:
+    """Observation counts per bucket, with their sum, per label combination"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label combination: [count per bucket (+Inf last), sum]
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the duration of the with block, even when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            # Modules imported by both apps share one instance per name
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Prometheus text format content type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "redflagged_stage_duration_seconds", "Time spent in each analysis stage", ("stage",)
+)
+LLM_TOKENS = REGISTRY.counter(
+    "redflagged_llm_tokens_total", "Tokens sent to and received from the LLM", ("model", "direction")
+)
+LLM_COST = REGISTRY.counter(
+    "redflagged_llm_cost_dollars_total", "Estimated LLM spend in US dollars", ("model",)
+)
+LLM_REQUESTS = REGISTRY.counter(
+    "redflagged_llm_requests_total", "LLM calls by outcome", ("model", "outcome")
+)
+FALLBACKS = REGISTRY.counter(
+    "redflagged_fallbacks_total", "Analyses answered by the pattern fallback", ("reason",)
+)
+PARSE_FAILURES = REGISTRY.counter(
+    "redflagged_llm_parse_failures_total", "LLM responses that were not valid JSON", ("model",)
+)
+RATE_LIMITED = REGISTRY.counter(
+    "redflagged_rate_limited_total", "Requests rejected by the rate limiter", ("route",)
+)
+OVERLOAD_REJECTIONS = REGISTRY.counter(
+    "redflagged_overload_rejections_total", "Requests rejected while waiting for an upstream slot"
+)
+CIRCUIT_STATE = REGISTRY.gauge(
+    "redflagged_circuit_open", "1 while a circuit breaker is open, 0.5 while half-open, 0 while closed",
+    ("circuit",)
+)
+CIRCUIT_TRANSITIONS = REGISTRY.counter(
+    "redflagged_circuit_transitions_total", "Circuit breaker state changes", ("circuit", "state")
+)
+COALESCED = REGISTRY.counter(
+    "redflagged_coalesced_requests_total", "Requests that joined an identical analysis already in flight",
+    ("operation",)
+)
+LLM_HEDGES = REGISTRY.counter(
+    "redflagged_llm_hedges_total", "Duplicate LLM calls started because the first was slow", ("winner",)
+)
+
+
+def _load_prices() -> Dict[str, Tuple[float, float]]:
+    prices = dict(LLM_PRICES)
+    override = os.getenv("LLM_PRICES", "")
+    if override:
+        prices.update({model: (float(p[0]), float(p[1])) for model, p in json.loads(override).items()})
+    return prices
+
+
+_PRICES = _load_prices()
+
+
+def record_llm_usage(model: str, usage: Optional[object]) -> None:
+    """Count the tokens and estimated cost of one LLM response"""
+    if usage is None:
+        return
+    input_tokens = getattr(usage, 'input_tokens', 0) or 0
+    output_tokens = getattr(usage, 'output_tokens', 0) or 0
+    LLM_TOKENS.inc(input_tokens, model=model, direction='input')
+    LLM_TOKENS.inc(output_tokens, model=model, direction='output')
+    input_price, output_price = _PRICES.get(model, (0.0, 0.0))
+    LLM_COST.inc((input_tokens * input_price + output_tokens * output_price) / 1_000_000, model=model)
@@ -0,0 +1,271 @@
+"""
+Red flag pattern engine
+Compiles the red flag patterns once at import and scans a document in a single pass
+"""
+
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever RED_FLAG_PATTERNS changes so cached results are invalidated
+PATTERN_SET_VERSION = "2"
+
+# Red flag patterns, in the order their flags are reported
+RED_FLAG_PATTERNS = {
+    'autoRenewal': {
+        'regex': r'(auto|automatic|automatically)\s+renew|renewal|renewed|renewing',
+        'severity': 'high',
+        'category': 'Automatic Renewal',
+        'description': 'Contract automatically renews without explicit consent',
+        'recommendation': 'Request removal or modification of automatic renewal clause'
+    },
+    'unclearCancellation': {
+        'regex': r'(cancel|cancellation|terminate|termination|end|ending|expire|expiration)',
+        'severity': 'medium',
+        'category': 'Cancellation Terms',
+        'description': 'Cancellation process is not clearly defined',
+        'recommendation': 'Request specific cancellation procedures and timelines'
+    },
+    'liability': {
+        'regex': r'(liability|responsible|responsibility|obligation|obligations|indemnify|indemnification)',
+        'severity': 'low',
+        'category': 'Liability',
+        'description': 'Standard liability limitations present',
+        'recommendation': 'Review liability limits and consider if they are reasonable'
+    },
+    'hiddenFees': {
+        'regex': r'(fee|fees|charge|charges|cost|costs|payment|payments|price|pricing|rate|rates)',
+        'severity': 'medium',
+        'category': 'Fees and Charges',
+        'description': 'Possible hidden fees or charges detected',
+        'recommendation': 'Request detailed breakdown of all fees and charges'
+    },
+    'dataCollection': {
+        'regex': r'(data|information|collect|collection|share|sharing|privacy|confidential|confidentiality)',
+        'severity': 'medium',
+        'category': 'Data Privacy',
+        'description': 'Extensive data collection or sharing terms present',
+        'recommendation': 'Review data collection and sharing policies'
+    },
+    'arbitration': {
+        'regex': r'(arbitration|arbitrate|arbitrator|dispute|disputes|litigation|court|courts)',
+        'severity': 'high',
+        'category': 'Dispute Resolution',
+        'description': 'Mandatory arbitration or dispute resolution terms present',
+        'recommendation': 'Review dispute resolution process and consider if it favors your interests'
+    },
+    'intellectualProperty': {
+        'regex': r'(intellectual property|patent|patents|copyright|copyrights|trademark|trademarks|license|licenses)',
+        'severity': 'medium',
+        'category': 'Intellectual Property',
+        'description': 'Intellectual property rights and licensing terms present',
+        'recommendation': 'Review IP rights and licensing terms carefully'
+    },
+    'nonCompete': {
+        'regex': r'(non-compete|noncompete|restrict|restriction|restrictions|compete|competition)',
+        'severity': 'high',
+        'category': 'Non-Compete',
+        'description': 'Non-compete or restrictive covenants present',
+        'recommendation': 'Review scope and duration of non-compete provisions'
+    },
+    'forceMajeure': {
+        'regex': r'(force majeure|act of god|unforeseen|unforeseeable|circumstances|beyond control)',
+        'severity': 'medium',
+        'category': 'Force Majeure',
+        'description': 'Force majeure or unforeseeable circumstances clause present',
+        'recommendation': 'Review force majeure provisions and their implications'
+    },
+    'assignment': {
+        'regex': r'(assign|assignment|transfer|transfers|transferable|assignable)',
+        'severity': 'medium',
+        'category': 'Assignment Rights',
+        'description': 'Contract assignment or transfer rights present',
+        'recommendation': 'Review assignment rights and restrictions'
+    }
+}
+
+# Engine selection: "compiled" (single pass), "legacy" (one scan per pattern)
+# or "compare" (run both, log any mismatch, return the compiled result)
+RED_FLAG_ENGINE = os.getenv("RED_FLAG_ENGINE", "compiled").lower()
+
+# A match is (pattern name, start offset, end offset, matched text)
+Match = Tuple[str, int, int, str]
+
+
+_REGEX_METACHARS = set('\\.^$*+?{}[]|()')
+_QUANTIFIERS = set('*+?{')
+
+
+def _split_alternatives(regex: str) -> List[str]:
+    """Split a regex on its top-level '|' characters"""
+    parts, depth, current, escaped = [], 0, [], False
+    for ch in regex:
+        if escaped:
+            escaped = False
+        elif ch == '\\':
+            escaped = True
+        elif ch in '([':
+            depth += 1
+        elif ch in ')]':
+            depth -= 1
+        elif ch == '|' and depth == 0:
+            parts.append(''.join(current))
+            current = []
+            continue
+        current.append(ch)
+    parts.append(''.join(current))
+    return parts
+
+
+def _literal_prefixes(regex: str) -> Optional[List[str]]:
+    """
+    Return literal strings that every match of the regex starts with one of,
+    or None when the regex is too complex to say.
+    """
+    prefixes = []
+    for alternative in _split_alternatives(regex):
+        if alternative.startswith('('):
+            # Leading group: its own alternatives give the prefixes, as long
+            # as the group is not optional
+            depth = 0
+            for i, ch in enumerate(alternative):
+                depth += {'(': 1, ')': -1}.get(ch, 0)
+                if depth == 0:
+                    break
+            if alternative[i + 1:i + 2] and alternative[i + 1] in _QUANTIFIERS:
+                return None
+            inner = alternative[1:i]
+            if inner.startswith('?:'):
+                inner = inner[2:]
+            elif inner.startswith('?'):
+                return None
+            inner_prefixes = _literal_prefixes(inner)
+            if inner_prefixes is None:
+                return None
+            prefixes.extend(inner_prefixes)
+            continue
+
+        end = 0
+        while end < len(alternative) and alternative[end] not in _REGEX_METACHARS:
+            end += 1
+        if end < len(alternative) and alternative[end] in _QUANTIFIERS:
+            end -= 1
+        if end <= 0:
+            return None
+        prefixes.append(alternative[:end])
+    return prefixes
+
+
+def _trie_regex(words: List[str]) -> str:
+    """Build a regex matching any of the words, factored as a trie"""
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word.lower():
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node: dict) -> str:
+        # A word ending here already makes this a candidate
+        if '' in node:
+            return ''
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items())]
+        if len(branches) == 1:
+            return branches[0]
+        return '(?:' + '|'.join(branches) + ')'
+
+    return build(trie)
+
+
+def compile_patterns(regexes: Dict[str, str]) -> "re.Pattern":
+    """
+    Build one case-insensitive matcher for named regexes.
+
+    The leading lookahead is a trie of the regexes' literal prefixes (plus any
+    regex without one), so the scan only stops at offsets where some regex
+    could match. The optional named lookaheads then record what each regex
+    matches from that offset. Nothing is consumed, so hits from different
+    regexes may overlap exactly as they did with separate scans.
+    """
+    prefixes = []
+    unprefixed = []
+    for regex in regexes.values():
+        regex_prefixes = _literal_prefixes(regex)
+        if regex_prefixes is None:
+            unprefixed.append(f"(?:{regex})")
+        else:
+            prefixes.extend(regex_prefixes)
+
+    candidates = ([_trie_regex(prefixes)] if prefixes else []) + unprefixed
+    per_pattern = ''.join(f"(?=(?P<{name}>{regex}))?" for name, regex in regexes.items())
+    return re.compile(f"(?=(?:{'|'.join(candidates)})){per_pattern}", re.IGNORECASE)
+
+
+def scan_patterns(compiled: "re.Pattern", text: str) -> Dict[str, List[Match]]:
+    """
+    Run a matcher from compile_patterns over the text once. Each regex keeps
+    the non-overlapping, leftmost semantics of its own re.finditer.
+    """
+    names = list(compiled.groupindex)
+    by_pattern: Dict[str, List[Match]] = {name: [] for name in names}
+    last_end = dict.fromkeys(names, 0)
+
+    for candidate in compiled.finditer(text):
+        pos = candidate.start()
+        for name, value in candidate.groupdict().items():
+            if value is None or pos < last_end[name]:
+                continue
+            # A regex that can match empty text would otherwise stall here
+            end = pos + len(value)
+            if end == pos:
+                continue
+            last_end[name] = end
+            by_pattern[name].append((name, pos, end, value))
+
+    return by_pattern
+
+
+_combined_pattern: Optional["re.Pattern"] = None
+_PATTERN_NAMES = list(RED_FLAG_PATTERNS)
+
+
+def get_combined_pattern() -> "re.Pattern":
+    """The matcher for every red flag pattern, compiled on first use or during warm-up"""
+    global _combined_pattern
+    if _combined_pattern is None:
+        _combined_pattern = compile_patterns({name: p['regex'] for name, p in RED_FLAG_PATTERNS.items()})
+    return _combined_pattern
+
+
+def find_matches_compiled(text: str) -> List[Match]:
+    """Find every pattern match in a single pass over the text"""
+    by_pattern = scan_patterns(get_combined_pattern(), text)
+    return [match for name in _PATTERN_NAMES for match in by_pattern[name]]
+
+
+def find_matches_legacy(text: str) -> List[Match]:
+    """Find every pattern match with one re.finditer scan per pattern"""
+    matches = []
+    for name, pattern in RED_FLAG_PATTERNS.items():
+        for match in re.finditer(pattern['regex'], text, re.IGNORECASE):
+            matches.append((name, match.start(), match.end(), match.group()))
+    return matches
+
+
+def find_matches(text: str) -> List[Match]:
+    """Find every pattern match using the engine selected by RED_FLAG_ENGINE"""
+    if RED_FLAG_ENGINE == 'legacy':
+        return find_matches_legacy(text)
+
+    matches = find_matches_compiled(text)
+    if RED_FLAG_ENGINE == 'compare':
+        legacy_matches = find_matches_legacy(text)
+        if matches != legacy_matches:
+            logger.warning(
+                f"Pattern engine mismatch: compiled found {len(matches)} matches, "
+                f"legacy found {len(legacy_matches)}"
+            )
+    return matches
@@ -0,0 +1,196 @@
+"""
+Rate limiting
+Sliding-window counters with O(1) checks and a pluggable storage backend
+"""
+
+import hashlib
+import json
+import logging
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimit(NamedTuple):
+    requests: int
+    window: float  # seconds
+
+
+def _sliding_window(window_index: int, current: int, previous: int,
+                    now: float, limit: RateLimit) -> Tuple[int, int, int, bool, float]:
+    """
+    Advance a key's two-window counter to now and decide whether one more
+    request fits. Returns the new (window_index, current, previous), whether
+    the request is allowed and, if not, how long until it would be.
+    """
+    now_index = int(now // limit.window)
+    if now_index != window_index:
+        previous = current if now_index == window_index + 1 else 0
+        current = 0
+        window_index = now_index
+
+    # Weight the previous window by how much of it still overlaps the sliding window
+    elapsed = (now % limit.window) / limit.window
+    estimated = previous * (1 - elapsed) + current
+    if estimated + 1 > limit.requests:
+        if previous and current < limit.requests:
+            # Wait until enough of the previous window has slid out
+            needed = (estimated + 1 - limit.requests) / previous
+            retry_after = needed * limit.window
+        else:
+            retry_after = (1 - elapsed) * limit.window
+        return window_index, current, previous, False, retry_after
+
+    return window_index, current + 1, previous, True, 0.0
+
+
+class InMemoryBackend:
+    """Per-process counters; idle keys are evicted oldest-first as time passes"""
+
+    # Checks never wait, so they can run on the event loop
+    blocking = False
+
+    def __init__(self, idle_timeout: float):
+        self.idle_timeout = idle_timeout
+        # key -> [window_index, current, previous, last_seen], least recently seen first
+        self._counters: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: RateLimit, now: float) -> Tuple[bool, float]:
+        with self._lock:
+            self._evict_idle(now)
+
+            state = self._counters.get(key)
+            if state is None:
+                state = self._counters[key] = [0, 0, 0, now]
+            else:
+                self._counters.move_to_end(key)
+
+            state[0], state[1], state[2], allowed, retry_after = _sliding_window(
+                state[0], state[1], state[2], now, limit
+            )
+            state[3] = now
+            return allowed, retry_after
+
+    def _evict_idle(self, now: float) -> None:
+        # Keys are ordered by last access, so stop at the first fresh one
+        while self._counters:
+            key, state = next(iter(self._counters.items()))
+            if now - state[3] < self.idle_timeout:
+                break
+            del self._counters[key]
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+
+class SQLiteBackend:
+    """Counters in a SQLite file so limits hold across uvicorn workers"""
+
+    # Checks may wait up to the busy timeout for another worker's write lock
+    blocking = True
+
+    def __init__(self, path: str, idle_timeout: float, sweep_interval: float = 60.0):
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            "key TEXT PRIMARY KEY, window_index INTEGER NOT NULL, current INTEGER NOT NULL, "
+            "previous INTEGER NOT NULL, last_seen REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_rate_limits_last_seen ON rate_limits (last_seen)"
+        )
+
+    def hit(self, key: str, limit: RateLimit, now: float) -> Tuple[bool, float]:
+        try:
+            return self._hit(key, limit, now)
+        except sqlite3.OperationalError as e:
+            # A database locked past the busy timeout lets the request through rather than failing it
+            logger.error(f"Rate limit check failed, allowing the request: {e}")
+            return True, 0.0
+
+    def _hit(self, key: str, limit: RateLimit, now: float) -> Tuple[bool, float]:
+        with self._lock:
+            if now - self._last_sweep >= self.sweep_interval:
+                self._conn.execute(
+                    "DELETE FROM rate_limits WHERE last_seen < ?", (now - self.idle_timeout,)
+                )
+                self._last_sweep = now
+
+            # IMMEDIATE takes the write lock up front so workers cannot interleave
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT window_index, current, previous FROM rate_limits WHERE key = ?", (key,)
+                ).fetchone()
+                window_index, current, previous = row if row else (0, 0, 0)
+                window_index, current, previous, allowed, retry_after = _sliding_window(
+                    window_index, current, previous, now, limit
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_limits "
+                    "(key, window_index, current, previous, last_seen) VALUES (?, ?, ?, ?, ?)",
+                    (key, window_index, current, previous, now)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return allowed, retry_after
+
+
+class RateLimiter:
+    """Chooses the limit for a request and checks it against the backend"""
+
+    def __init__(self, backend, default_limit: RateLimit,
+                 route_limits: Optional[Dict[str, RateLimit]] = None,
+                 api_key_limits: Optional[Dict[str, RateLimit]] = None):
+        self.backend = backend
+        self.default_limit = default_limit
+        # Longest prefix wins
+        self.route_limits = sorted((route_limits or {}).items(), key=lambda item: -len(item[0]))
+        self.api_key_limits = api_key_limits or {}
+        # Whether check() can block and so belongs off the event loop
+        self.blocking = getattr(backend, 'blocking', False)
+
+    def route_for(self, path: str) -> Tuple[str, RateLimit]:
+        """The configured route prefix ('*' for none) and limit that apply to a path"""
+        for prefix, route_limit in self.route_limits:
+            if path.startswith(prefix):
+                return prefix, route_limit
+        return '*', self.default_limit
+
+    def check(self, path: str, client_ip: str, api_key: Optional[str] = None) -> Tuple[bool, float]:
+        """Record one request; returns whether it is allowed and the Retry-After seconds"""
+        route, limit = self.route_for(path)
+
+        if api_key and api_key in self.api_key_limits:
+            # Known API keys get their own budget regardless of the client IP
+            identity = 'key:' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+            limit = self.api_key_limits[api_key]
+        else:
+            identity = 'ip:' + client_ip
+
+        allowed, retry_after = self.backend.hit(f"{route}|{identity}", limit, time.time())
+        return allowed, math.ceil(retry_after)
+
+
+def parse_limits(value: str) -> Dict[str, RateLimit]:
+    """Parse a JSON object of name -> [requests, window_seconds]"""
+    if not value:
+        return {}
+    return {name: RateLimit(int(spec[0]), float(spec[1])) for name, spec in json.loads(value).items()}
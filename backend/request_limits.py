@@ -0,0 +1,97 @@
+"""
+Request body limits
+ASGI middleware that rejects oversized bodies while they stream in, before they are buffered
+"""
+
+import json
+from typing import Dict, Optional
+
+from starlette.exceptions import HTTPException
+
+
+class BodyTooLargeError(HTTPException):
+    """
+    An HTTPException, so frameworks that wrap body-reading errors (FastAPI turns
+    them into 400s) pass it through and answer with a 413
+    """
+
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail=f"Request body exceeds {limit} bytes")
+
+
+class BodySizeLimitMiddleware:
+    """
+    Enforce a maximum request body size per path prefix.
+    A Content-Length over the limit is refused up front; chunked bodies are
+    counted as they are received and cut off as soon as they pass the limit.
+    """
+
+    def __init__(self, app, limits: Dict[str, int], default_limit: Optional[int] = None):
+        self.app = app
+        # Longest prefix first so specific routes win over general ones
+        self.limits = sorted(limits.items(), key=lambda item: -len(item[0]))
+        self.default_limit = default_limit
+
+    def limit_for(self, path: str) -> Optional[int]:
+        for prefix, limit in self.limits:
+            if path.startswith(prefix):
+                return limit
+        return self.default_limit
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.limit_for(scope["path"])
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    declared = 0
+                if declared > limit:
+                    await self._reject(send, limit)
+                    return
+                break
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise BodyTooLargeError(limit)
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except BodyTooLargeError:
+            if not response_started:
+                await self._reject(send, limit)
+
+    @staticmethod
+    async def _reject(send, limit: int):
+        body = json.dumps({"detail": f"Request body exceeds {limit} bytes"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
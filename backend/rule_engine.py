@@ -0,0 +1,226 @@
+"""
+Constitutional rule engine
+Compiles contract_audit_constitution.yaml into one matcher and evaluates every rule in a single pass
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from pattern_engine import compile_patterns, scan_patterns
+from segmenter import BoundaryIndex
+
+logger = logging.getLogger(__name__)
+
+CONSTITUTION_PATH = os.getenv(
+    "CONSTITUTION_PATH",
+    str(Path(__file__).parent / "constitution" / "contract_audit_constitution.yaml")
+)
+# Seconds between checks of the constitution file for changes
+CONSTITUTION_RELOAD_INTERVAL = float(os.getenv("CONSTITUTION_RELOAD_INTERVAL", "2"))
+
+# Evidence snippets kept per rule
+MAX_EVIDENCE = 3
+
+# Which calibration threshold applies to each severity
+SEVERITY_THRESHOLDS = {
+    'CRITICAL': 'critical',
+    'HIGH': 'high',
+    'MEDIUM': 'medium',
+    'REQUIRED': 'required'
+}
+
+# Unbounded wildcards in rule patterns may only span this many characters of
+# one sentence, so every match attempt costs a bounded amount of work
+WILDCARD_MAX_CHARS = 200
+_WILDCARD = re.compile(r'(?<!\\)\.([*+])')
+
+
+def bound_wildcards(regex: str) -> str:
+    """Rewrite .* and .+ as a bounded run of non-sentence-ending characters"""
+    return _WILDCARD.sub(
+        lambda m: f"[^.!?\\n]{{{0 if m.group(1) == '*' else 1},{WILDCARD_MAX_CHARS}}}", regex
+    )
+
+
+class ConstitutionEngine:
+    """One compiled version of the constitution"""
+
+    def __init__(self, constitution: Dict[str, Any], version: str = ""):
+        self.name = constitution.get('name', '')
+        self.version = str(constitution.get('version', version))
+        self.thresholds = constitution.get('calibration', {}).get('confidence_thresholds', {})
+
+        self.rules: List[Dict[str, Any]] = []
+        for group in (constitution.get('audit_rules') or {}).values():
+            for rule in group or []:
+                self.rules.append({**rule, 'kind': 'violation', 'id': rule['rule_id']})
+        for clause in constitution.get('required_clauses') or []:
+            self.rules.append({**clause, 'kind': 'required_clause', 'id': clause['clause_id']})
+
+        # Every detection pattern and required element becomes one named group
+        # in a single matcher; the index maps a group back to its rule
+        regexes = {}
+        self._group_index: Dict[str, tuple] = {}
+        for rule_number, rule in enumerate(self.rules):
+            for pattern_number, pattern in enumerate(rule.get('detection_patterns') or []):
+                group = f"r{rule_number}p{pattern_number}"
+                regexes[group] = bound_wildcards(pattern)
+                self._group_index[group] = (rule_number, 'pattern', pattern)
+            missing = (rule.get('required_elements') or {}).get('missing') or []
+            for element_number, element in enumerate(missing):
+                group = f"r{rule_number}e{element_number}"
+                regexes[group] = bound_wildcards(element)
+                self._group_index[group] = (rule_number, 'element', element)
+
+        self._matcher = compile_patterns(regexes) if regexes else None
+        self.max_score = sum(rule.get('weight', 0) for rule in self.rules)
+
+    def _threshold(self, severity: str) -> float:
+        return float(self.thresholds.get(SEVERITY_THRESHOLDS.get(severity, 'medium'), 0.0))
+
+    def evaluate(self, text: str) -> Dict[str, Any]:
+        """Evaluate every rule against the text in one scan"""
+        hits: List[Dict[str, list]] = [{'pattern': [], 'element': []} for _ in self.rules]
+        if self._matcher is not None:
+            for group, matches in scan_patterns(self._matcher, text).items():
+                if matches:
+                    rule_number, kind, source = self._group_index[group]
+                    hits[rule_number][kind].append((source, matches))
+
+        boundaries = BoundaryIndex(text)
+        word_count = len(text.split())
+        violations = []
+        missing_clauses = []
+        score = 0.0
+
+        for rule, rule_hits in zip(self.rules, hits):
+            severity = rule.get('severity', 'MEDIUM')
+            threshold = self._threshold(severity)
+            matched_patterns = [source for source, _ in rule_hits['pattern']]
+
+            if rule['kind'] == 'violation':
+                if not matched_patterns:
+                    continue
+                all_matches = sorted(
+                    (m for _, matches in rule_hits['pattern'] for m in matches),
+                    key=lambda m: m[1]
+                )
+                evidence = []
+                for _, start, end, _ in all_matches[:MAX_EVIDENCE]:
+                    ctx_start, ctx_end = boundaries.context_span(start, end)
+                    evidence.append({
+                        'text': text[ctx_start:ctx_end].strip(),
+                        'start': start,
+                        'end': end
+                    })
+                present_elements = {source for source, _ in rule_hits['element']}
+                missing_elements = [
+                    element for element in (rule.get('required_elements') or {}).get('missing') or []
+                    if element not in present_elements
+                ]
+
+                # More distinct patterns and repeated hits raise confidence;
+                # safeguards that are present lower it
+                confidence = 0.6 + 0.15 * (len(matched_patterns) - 1) + 0.05 * min(len(all_matches) - 1, 4)
+                confidence -= 0.1 * len(present_elements)
+                confidence = round(min(max(confidence, 0.05), 0.99), 2)
+
+                score += rule.get('weight', 0) * confidence
+                violations.append({
+                    'rule_id': rule['id'],
+                    'name': rule.get('name', ''),
+                    'description': rule.get('description', ''),
+                    'severity': severity,
+                    'weight': rule.get('weight', 0),
+                    'confidence': confidence,
+                    'threshold': threshold,
+                    'needs_review': confidence < threshold,
+                    'matched_patterns': matched_patterns,
+                    'missing_elements': missing_elements,
+                    'evidence': evidence,
+                    'spans': [[start, end] for _, start, end, _ in all_matches],
+                    'judgment': (rule.get('judgment_template') or '').replace(
+                        '{evidence_text}', evidence[0]['text'] if evidence else ''
+                    ).strip()
+                })
+            elif not matched_patterns:
+                # Absence is more certain the more text we have looked at
+                confidence = round(min(0.95, 0.5 + word_count / 2000), 2)
+                score += rule.get('weight', 0) * confidence
+                missing_clauses.append({
+                    'clause_id': rule['id'],
+                    'name': rule.get('name', ''),
+                    'description': rule.get('description', ''),
+                    'severity': severity,
+                    'weight': rule.get('weight', 0),
+                    'confidence': confidence,
+                    'threshold': threshold,
+                    'needs_review': confidence < threshold,
+                    'judgment': (rule.get('judgment_template') or '').replace('{evidence_text}', '').strip()
+                })
+
+        return {
+            'constitution_version': self.version,
+            'violations': violations,
+            'missing_clauses': missing_clauses,
+            'weighted_score': round(score, 2),
+            'max_score': self.max_score,
+            'risk_score': round(100 * score / self.max_score, 1) if self.max_score else 0.0
+        }
+
+
+def load_engine(path: str = CONSTITUTION_PATH) -> ConstitutionEngine:
+    # Imported here so workers start without the YAML parser until the first load
+    import yaml
+
+    with open(path, 'r', encoding='utf-8') as f:
+        document = yaml.safe_load(f) or {}
+    return ConstitutionEngine(document.get('constitution', {}))
+
+
+_engine: Optional[ConstitutionEngine] = None
+_engine_mtime = 0.0
+_last_check = 0.0
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> ConstitutionEngine:
+    """
+    Return the compiled constitution, recompiling it when the file has changed.
+    A constitution that fails to load keeps the previous engine in service.
+    """
+    global _engine, _engine_mtime, _last_check
+
+    now = time.monotonic()
+    if _engine is not None and now - _last_check < CONSTITUTION_RELOAD_INTERVAL:
+        return _engine
+
+    with _engine_lock:
+        _last_check = now
+        try:
+            mtime = os.stat(CONSTITUTION_PATH).st_mtime
+        except OSError as e:
+            if _engine is None:
+                raise
+            logger.error(f"Cannot stat constitution file: {e}")
+            return _engine
+
+        if _engine is None or mtime != _engine_mtime:
+            try:
+                engine = load_engine(CONSTITUTION_PATH)
+            except Exception as e:
+                if _engine is None:
+                    raise
+                # Do not retry the same broken file on every check
+                _engine_mtime = mtime
+                logger.error(f"Failed to reload constitution, keeping version {_engine.version}: {e}")
+                return _engine
+            logger.info(f"Loaded constitution version {engine.version} with {len(engine.rules)} rules")
+            _engine, _engine_mtime = engine, mtime
+
+    return _engine
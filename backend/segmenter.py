@@ -0,0 +1,68 @@
+"""
+Sentence and clause segmentation
+Builds sorted boundary arrays once per document so context lookups are a bisect
+"""
+
+import os
+import re
+from bisect import bisect_left, bisect_right
+from typing import List, Tuple
+
+SENTENCE_DELIMITERS = '.!?'
+CLAUSE_DELIMITERS = ';:\n'
+
+# Characters of context kept on each side of a match before widening to the
+# surrounding sentence
+CONTEXT_WINDOW = 90
+
+# Upper bound on the length of a context snippet; punctuation-poor pages would
+# otherwise widen a single match to most of the document
+CONTEXT_MAX_LENGTH = int(os.getenv("RED_FLAG_CONTEXT_MAX_LENGTH", "600"))
+
+_DELIMITER_PATTERN = re.compile(f"[{re.escape(SENTENCE_DELIMITERS + CLAUSE_DELIMITERS)}]")
+
+
+class BoundaryIndex:
+    """Sorted sentence and clause boundary offsets for one document"""
+
+    def __init__(self, text: str):
+        self.length = len(text)
+        self.sentences: List[int] = []
+        # Clause boundaries include sentence boundaries
+        self.clauses: List[int] = []
+
+        for match in _DELIMITER_PATTERN.finditer(text):
+            pos = match.start()
+            if text[pos] in SENTENCE_DELIMITERS:
+                self.sentences.append(pos)
+            self.clauses.append(pos)
+
+    def _expand(self, boundaries: List[int], start: int, end: int) -> Tuple[int, int]:
+        """Widen [start, end) to the nearest boundary at or before start and at or after end"""
+        i = bisect_right(boundaries, start)
+        new_start = boundaries[i - 1] if i else 0
+        j = bisect_left(boundaries, end)
+        new_end = boundaries[j] if j < len(boundaries) else self.length
+        return new_start, new_end
+
+    def context_span(self, match_start: int, match_end: int,
+                     window: int = CONTEXT_WINDOW,
+                     max_length: int = CONTEXT_MAX_LENGTH) -> Tuple[int, int]:
+        """
+        Return the span of the sentence around a match, falling back to the
+        surrounding clause and then to a hard cut when it exceeds max_length.
+        """
+        start = max(0, match_start - window)
+        end = min(self.length, match_end + window)
+
+        span = self._expand(self.sentences, start, end)
+        if span[1] - span[0] <= max_length:
+            return span
+
+        span = self._expand(self.clauses, start, end)
+        if span[1] - span[0] <= max_length:
+            return span
+
+        # Keep the match roughly centered inside the cap
+        margin = max(0, max_length - (match_end - match_start)) // 2
+        return max(0, match_start - margin), min(self.length, match_end + margin)
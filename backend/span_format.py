@@ -0,0 +1,53 @@
+"""
+Span offsets
+Maps character offsets in prepared (normalized and escaped) text back to the text the client submitted
+"""
+
+import re
+from bisect import bisect_right
+from typing import Dict, List
+
+
+class OffsetMap:
+    """
+    Built from the submitted text and the single-character rewrites that
+    prepared it. Only rewritten characters are recorded, so building and
+    lookups cost in proportion to those, not to the text length.
+    """
+
+    def __init__(self, submitted: str, pattern: re.Pattern, replacements: Dict[str, str]):
+        lead = len(submitted) - len(submitted.lstrip())
+        self._lead = lead
+        # Per rewrite: where it starts in the prepared text, its length there,
+        # where it came from, and the shift to apply after it
+        self._starts: List[int] = []
+        self._lengths: List[int] = []
+        self._sources: List[int] = []
+        self._shifts: List[int] = []
+
+        shift = lead
+        for match in pattern.finditer(submitted, lead):
+            length = len(replacements[match.group()])
+            self._starts.append(match.start() - shift)
+            self._lengths.append(length)
+            self._sources.append(match.start())
+            shift -= length - 1
+            self._shifts.append(shift)
+
+    def to_source(self, offset: int, end: bool = False) -> int:
+        """
+        Submitted-text offset for a prepared-text offset. An end offset maps to
+        just past the character before it, so it never takes in dropped characters.
+        """
+        if end:
+            return self.to_source(offset - 1) + 1 if offset > 0 else self._lead
+        index = bisect_right(self._starts, offset) - 1
+        if index < 0:
+            return offset + self._lead
+        if offset < self._starts[index] + self._lengths[index]:
+            # Inside an escape sequence: the character it replaced
+            return self._sources[index]
+        return offset + self._shifts[index]
+
+    def to_source_span(self, start: int, end: int) -> List[int]:
+        return [self.to_source(start), self.to_source(end, end=True)]
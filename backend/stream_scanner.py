@@ -0,0 +1,142 @@
+"""
+Streaming red flag scanner
+Scans text that arrives in chunks through overlapping windows, so memory stays flat whatever the document size
+"""
+
+import heapq
+import itertools
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from pattern_engine import get_combined_pattern
+from segmenter import CONTEXT_MAX_LENGTH, CONTEXT_WINDOW, BoundaryIndex
+
+# Characters scanned per window; each window also holds a few context lengths of overlap
+STREAM_WINDOW_CHARS = int(os.getenv("STREAM_WINDOW_CHARS", str(64 * 1024)))
+
+
+class StreamMatch(NamedTuple):
+    """A pattern match with its context; offsets index the whole stripped stream"""
+    pattern: str
+    start: int
+    end: int
+    text: str
+    context: str
+
+
+class WindowedScanner:
+    """
+    Finds the matches and contexts analyze_red_flags would find in the
+    stripped text, in document order, while holding one window of it.
+
+    A match is reported from the first window that has max_context characters
+    (the furthest a context span reaches) on both sides of it, so the window
+    sees the same sentence boundaries the whole text would. The next window
+    starts that far back. Only matches longer than max_context can differ from
+    a scan of the whole text.
+    """
+
+    def __init__(self, max_context: int = CONTEXT_MAX_LENGTH, window_chars: int = STREAM_WINDOW_CHARS):
+        self.max_context = max_context
+        self.margin = max(max_context, CONTEXT_WINDOW) + 1
+        self.window_chars = max(window_chars, 4 * self.margin)
+        self._pattern = get_combined_pattern()
+        self._names = list(self._pattern.groupindex)
+        self._last_end = dict.fromkeys(self._names, 0)
+        self._buffer = ''
+        # Stream offset of the buffer's first character, and of the first position not yet scanned
+        self._offset = 0
+        self._scanned = 0
+        self._started = False
+
+    def feed(self, chunk: str) -> Iterator[StreamMatch]:
+        """Add text and yield the matches that no later text can change"""
+        if not self._started:
+            # Leading whitespace is stripped, as prepare_text does
+            chunk = chunk.lstrip()
+            self._started = bool(chunk)
+        self._buffer += chunk
+        # Trailing whitespace may be the end of the document, which is stripped too,
+        # so a window is only scanned once text follows it
+        available = len(self._buffer.rstrip())
+        while available >= self.window_chars:
+            offset = self._offset
+            yield from self._scan(self._buffer[:self.window_chars], offset + self.window_chars - 2 * self.margin)
+            available -= self._offset - offset
+
+    def finish(self) -> Iterator[StreamMatch]:
+        """Yield the remaining matches once the stream has ended"""
+        yield from self._scan(self._buffer.rstrip(), None)
+        self._buffer = ''
+
+    def _scan(self, window: str, limit: Optional[int]) -> Iterator[StreamMatch]:
+        """Yield matches starting before the stream offset limit (None for the end) and slide the buffer"""
+        offset = self._offset
+        boundaries: Optional[BoundaryIndex] = None
+        for candidate in self._pattern.finditer(window, self._scanned - offset):
+            pos = candidate.start() + offset
+            if limit is not None and pos >= limit:
+                break
+            for name, value in candidate.groupdict().items():
+                if value is None or pos < self._last_end[name]:
+                    continue
+                end = pos + len(value)
+                if end == pos:
+                    continue
+                self._last_end[name] = end
+                if boundaries is None:
+                    boundaries = BoundaryIndex(window)
+                start, stop = boundaries.context_span(pos - offset, end - offset, max_length=self.max_context)
+                yield StreamMatch(name, pos, end, value, window[start:stop].strip())
+
+        if limit is None:
+            self._scanned = offset + len(window)
+            return
+        self._scanned = limit
+        keep_from = limit - self.margin - offset
+        self._buffer = self._buffer[keep_from:]
+        self._offset += keep_from
+
+
+def scan_stream(chunks: Iterable[str], max_context: int = CONTEXT_MAX_LENGTH,
+                window_chars: int = STREAM_WINDOW_CHARS) -> Iterator[StreamMatch]:
+    """Yield the matches in a stream of text chunks as soon as each is final"""
+    scanner = WindowedScanner(max_context, window_chars)
+    for chunk in chunks:
+        yield from scanner.feed(chunk)
+    yield from scanner.finish()
+
+
+def iter_chunks(text: str, size: int = STREAM_WINDOW_CHARS) -> Iterator[str]:
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+class TopFlags:
+    """
+    The highest-confidence flags of each category, limit per category, in a
+    min-heap per category. Ties keep the earlier flag. Every flag is counted.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.counts: Dict[str, int] = defaultdict(int)
+        self._heaps: Dict[str, list] = defaultdict(list)
+        self._sequence = itertools.count()
+
+    def add(self, flag: dict) -> None:
+        category = flag['category']
+        self.counts[category] += 1
+        heap = self._heaps[category]
+        # -sequence makes the latest of equally confident flags the first evicted
+        entry = (flag['confidence'], -next(self._sequence), flag)
+        if len(heap) < self.limit:
+            heapq.heappush(heap, entry)
+        else:
+            heapq.heappushpop(heap, entry)
+
+    def flags(self) -> List[dict]:
+        """The kept flags in document order"""
+        entries = [entry for heap in self._heaps.values() for entry in heap]
+        return [flag for _, _, flag in sorted(entries, key=lambda entry: -entry[1])]
@@ -0,0 +1,136 @@
+"""
+Document type detection
+Counts type keywords from one tokenization of the text, sampling windows of very large documents
+"""
+
+import os
+import re
+from collections import Counter
+from typing import Dict, List, NamedTuple, Tuple
+
+# Keywords per document type; words also match their inflections, multi-word entries are matched as phrases
+DOCUMENT_TYPE_KEYWORDS = {
+    'legal_agreement': ['agreement', 'contract', 'terms', 'parties', 'whereas', 'hereby', 'shall', 'party',
+                        'clause', 'provision'],
+    'financial_report': ['revenue', 'profit', 'financial', 'quarter', 'fiscal', 'earnings', 'balance', 'income',
+                         'cash flow'],
+    'policy_document': ['policy', 'procedure', 'guidelines', 'compliance', 'standard', 'regulation',
+                        'requirement'],
+    'technical_spec': ['specification', 'requirements', 'architecture', 'design', 'implementation', 'technical',
+                       'system'],
+    'employment_contract': ['employment', 'employee', 'employer', 'salary', 'benefits', 'termination', 'duties',
+                            'responsibilities'],
+    'lease_agreement': ['lease', 'rental', 'tenant', 'landlord', 'property', 'premises', 'rent',
+                        'security deposit']
+}
+
+DEFAULT_DOCUMENT_TYPE = 'legal_agreement'
+# Score added when the filename names the type
+FILENAME_BOOST = 5
+
+# Texts up to this size are scanned whole; larger ones are sampled in windows
+DETECT_FULL_SCAN_CHARS = int(os.getenv("DETECT_FULL_SCAN_CHARS", "8192"))
+DETECT_WINDOW_CHARS = int(os.getenv("DETECT_WINDOW_CHARS", "2048"))
+DETECT_MAX_WINDOWS = int(os.getenv("DETECT_MAX_WINDOWS", "8"))
+# Sampling stops once the leader has this many times the runner-up's hits, with at least DETECT_MIN_HITS seen
+DETECT_LEAD_RATIO = float(os.getenv("DETECT_LEAD_RATIO", "1.5"))
+DETECT_MIN_HITS = int(os.getenv("DETECT_MIN_HITS", "20"))
+
+# Hyphenated and apostrophe words stay whole, so "third-party" is not "party"
+_WORD = re.compile(r"[a-z]+(?:['-][a-z]+)*")
+
+
+def _inflections(keyword: str) -> List[str]:
+    """The keyword with its plural, verb and adverb endings ("lease", "leases", "leased", "leasing")"""
+    forms = [keyword, keyword + 's', keyword + 'es', keyword + 'ed', keyword + 'ing', keyword + 'ly']
+    if keyword.endswith('e'):
+        forms += [keyword + 'd', keyword[:-1] + 'ing']
+    if keyword.endswith('y'):
+        forms.append(keyword[:-1] + 'ies')
+    return forms
+
+
+def _build_tables() -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+    words: Dict[str, List[str]] = {}
+    phrases: Dict[str, List[str]] = {}
+    for doc_type, keywords in DOCUMENT_TYPE_KEYWORDS.items():
+        for keyword in keywords:
+            if ' ' in keyword:
+                phrases.setdefault(keyword, []).append(doc_type)
+                continue
+            for form in _inflections(keyword):
+                # A word counts once per type, so "parties" is not counted for both "party" and "parties"
+                doc_types = words.setdefault(form, [])
+                if doc_type not in doc_types:
+                    doc_types.append(doc_type)
+    return words, phrases
+
+
+_KEYWORD_TYPES, _PHRASE_TYPES = _build_tables()
+
+
+class TypeDetection(NamedTuple):
+    document_type: str
+    confidence: float
+    scores: Dict[str, int]
+    sampled: bool
+
+
+def _count(sample: str, scores: Dict[str, int]) -> int:
+    """Add one sample's keyword counts to scores and return the hits found"""
+    sample = sample.lower()
+    counts = Counter(_WORD.findall(sample))
+    hits = 0
+    for keyword, doc_types in _KEYWORD_TYPES.items():
+        n = counts.get(keyword)
+        if n:
+            hits += n
+            for doc_type in doc_types:
+                scores[doc_type] += n
+    for phrase, doc_types in _PHRASE_TYPES.items():
+        n = sample.count(phrase)
+        if n:
+            hits += n
+            for doc_type in doc_types:
+                scores[doc_type] += n
+    return hits
+
+
+def _window_offsets(length: int, window: int, max_windows: int) -> List[int]:
+    """Start of the text first, then evenly spread windows through the rest"""
+    count = min(max_windows, max(length // window, 1))
+    step = (length - window) / max(count - 1, 1)
+    return [int(i * step) for i in range(count)]
+
+
+def detect_type(text: str, filename: str = "", sample: bool = True) -> TypeDetection:
+    """
+    Score every document type by keyword frequency. With sample set, a text
+    longer than DETECT_FULL_SCAN_CHARS is read window by window and the scan
+    stops as soon as one type leads clearly.
+    """
+    scores = {doc_type: 0 for doc_type in DOCUMENT_TYPE_KEYWORDS}
+    sampled = sample and len(text) > DETECT_FULL_SCAN_CHARS
+
+    if not sampled:
+        hits = _count(text, scores)
+    else:
+        hits = 0
+        for offset in _window_offsets(len(text), DETECT_WINDOW_CHARS, DETECT_MAX_WINDOWS):
+            hits += _count(text[offset:offset + DETECT_WINDOW_CHARS], scores)
+            if hits >= DETECT_MIN_HITS:
+                runner_up, leader = sorted(scores.values())[-2:]
+                if leader >= DETECT_LEAD_RATIO * runner_up:
+                    break
+
+    if filename:
+        name = filename.lower()
+        for doc_type in scores:
+            if doc_type.replace('_', '') in name:
+                scores[doc_type] += FILENAME_BOOST
+
+    # Ties keep table order, so a text with no keywords is a legal agreement
+    best_type = max(scores, key=scores.get) if any(scores.values()) else DEFAULT_DOCUMENT_TYPE
+    total = sum(scores.values())
+    confidence = round(scores[best_type] / total, 2) if total else 0.0
+    return TypeDetection(best_type, confidence, scores, sampled)
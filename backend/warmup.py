@@ -0,0 +1,35 @@
+"""
+Warm-up
+Compiles the red flag patterns and the constitution and runs each analysis path once at startup,
+so the first request does not pay for it
+"""
+
+import logging
+import time
+from typing import Callable
+
+from pattern_engine import find_matches, get_combined_pattern
+from rule_engine import get_engine
+
+logger = logging.getLogger(__name__)
+
+# Touches every pattern family so lazily built state is built here
+WARM_UP_TEXT = (
+    "This Agreement will automatically renew each year unless you cancel in writing. "
+    "We may share your personal data with third parties and affiliates. "
+    "You agree to binding arbitration and waive any class action. "
+    "The company is not responsible for any damages and may change these terms at any time; "
+    "you must indemnify us against all claims.\n"
+    "Payment of all fees is due on signing and is non-refundable.\n"
+)
+
+
+def warm_up(*steps: Callable[[str], object]) -> None:
+    """Compile the shared patterns and rule tables, then run each step on a sample document"""
+    start = time.perf_counter()
+    get_combined_pattern()
+    find_matches(WARM_UP_TEXT)
+    get_engine().evaluate(WARM_UP_TEXT)
+    for step in steps:
+        step(WARM_UP_TEXT)
+    logger.info(f"Warm-up finished in {(time.perf_counter() - start) * 1000:.0f}ms")